@@ -0,0 +1,68 @@
+import numpy as np
+
+# Analysis of the strain energy curves, independent of Abaqus so that archived curves can be scored again.
+# A curve is an energy array and the matching displacement (frame value) array. Several curves of the same
+# length can be stacked in 2D arrays, one curve per row; shorter curves are padded with NaN at the end.
+
+
+def derivative(energy, displacement):
+    # slope of the energy between consecutive frames, the last frame is left out as in the original analysis
+    energy = np.asarray(energy, dtype=float)
+    displacement = np.asarray(displacement, dtype=float)
+    return (np.diff(energy, axis=-1) / np.diff(displacement, axis=-1))[..., :-1]
+
+
+def wells(energy, displacement):
+    # every region of negative slope of one curve: index of the last positive slope before the region,
+    # index of the last negative slope of the region and relative energy drop across the region
+    energy = np.asarray(energy, dtype=float)
+    negative = (derivative(energy, displacement) < 0).astype(np.int8)
+    change = np.diff(np.concatenate(([0], negative, [0])))
+    start = np.flatnonzero(change == 1) - 1
+    end = np.flatnonzero(change == -1) - 1
+    top = energy[start + 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (top - energy[end + 1]) / top
+    return start, end, delta
+
+
+def barrier_batch(energy, displacement, threshold=0.25):
+    # relative energy barrier of the last well of each curve, -inf when the curve has no negative slope
+    # or when the well starts before `threshold` of the loading
+    energy = np.atleast_2d(np.asarray(energy, dtype=float))
+    displacement = np.broadcast_to(np.asarray(displacement, dtype=float), energy.shape)
+    delta = np.full(energy.shape[0], -np.inf)
+    if energy.shape[1] < 3:
+        return delta
+
+    slope = derivative(energy, displacement)
+    index = np.arange(slope.shape[1])
+    frames = np.sum(np.isfinite(energy), axis=1)
+    # the slope to the last frame of a padded curve is finite, it is left out as for the curve alone
+    negative = (slope < 0) & (index < frames[:, None] - 2)
+    end = np.where(negative, index, -1).max(axis=1)
+    start = np.where(~negative & (index < end[:, None]), index, -1).max(axis=1)
+    length = np.maximum(frames - 2, 1)
+
+    feasible = (end >= 0) & (start.astype(float) / length > threshold)
+    rows = np.flatnonzero(feasible)
+    top = energy[rows, start[rows] + 2]
+    delta[rows] = (top - energy[rows, end[rows] + 1]) / top
+    return delta
+
+
+def barrier(energy, displacement, threshold=0.25):
+    return float(barrier_batch(energy, displacement, threshold)[0])
+
+
+def snap_through(energy, displacement, travel=1.0):
+    # peak reaction force and stroke at the top of the last well of one curve; under displacement control the
+    # reaction force is the slope of the strain energy (work of the imposed displacement), `travel` turns the
+    # step time into the displacement of the loaded vertex
+    energy = np.asarray(energy, dtype=float)
+    displacement = np.asarray(displacement, dtype=float)
+    slope = derivative(energy, displacement) / travel
+    force = float(np.max(np.abs(slope))) if len(slope) else float('nan')
+    start, end, delta = wells(energy, displacement)
+    stroke = float(displacement[start[-1] + 2] * travel) if len(start) else float('nan')
+    return {"force": force, "stroke": stroke}
@@ -0,0 +1,184 @@
+import glob
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from cache import model_hash
+
+# Archive of a campaign: design vector, objective, status, timings and full energy curve of every evaluation.
+# The evaluations are stored by chunks of `chunk_size` in folders of plain .npy columns, read memory-mapped:
+#     chunk_00000/x.npy, objective.npy, status.npy, ...   one row per evaluation
+#     chunk_00000/offset.npy, energy.npy, displacement.npy  curves concatenated, offset[i]:offset[i + 1] for row i
+#     chunk_00000/timings.json                              phases of every row, only read on request
+# The evaluations of the chunk being filled are appended to pending.jsonl, so that none is lost in a crash.
+# Rows are numbered in the order of the evaluations, over all the chunks.
+# Summary of a campaign: python archive.py [archive]
+
+pending_name = "pending.jsonl"
+columns = {"x": float, "objective": float, "status": "<U12", "elapsed": float, "created": float,
+           "mesh_scale": float, "project": "<U24", "model": "<U40"}
+
+
+class Chunk:
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.data = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+                     for name in list(columns) + ["offset", "energy", "displacement"]}
+
+    def __len__(self):
+        return len(self.data["objective"])
+
+    def curve(self, row):
+        start, end = self.data["offset"][row], self.data["offset"][row + 1]
+        return np.array(self.data["energy"][start:end]), np.array(self.data["displacement"][start:end])
+
+    def timings(self):
+        with open(os.path.join(self.folder, "timings.json"), "r") as f:
+            return json.load(f)
+
+
+class Archive:
+
+    def __init__(self, folder="archive", chunk_size=1000):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        # a chunk left half-written by a crash is removed, its evaluations are still in pending.jsonl
+        for path in glob.glob(os.path.join(folder, "chunk_*.tmp")):
+            shutil.rmtree(path, ignore_errors=True)
+        self.chunks = [Chunk(path) for path in sorted(glob.glob(os.path.join(folder, "chunk_" + "[0-9]" * 5)))]
+        self.pending = []
+        path = os.path.join(folder, pending_name)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        self.pending.append(json.loads(line))
+                    except ValueError:  # last line cut by a crash
+                        break
+        if self.chunks and self.pending:
+            # crash between the rename of the last chunk and the removal of pending.jsonl: its entries are
+            # already in the chunk
+            stored = set(np.asarray(self.chunks[-1].data["created"]).tolist())
+            self.pending = [entry for entry in self.pending if entry["created"] not in stored]
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks) + len(self.pending)
+
+    def add(self, x, objective, status, energy=None, displacement=None, elapsed=None, mesh_scale=1.0,
+            project="", timings=None, model=None):
+        entry = {"x": [float(xi) for xi in x], "objective": float(objective), "status": status,
+                 "elapsed": float("nan") if elapsed is None else float(elapsed), "created": time.time(),
+                 "mesh_scale": float(mesh_scale), "project": project, "model": model or model_hash(),
+                 "energy": [] if energy is None else np.asarray(energy, dtype=float).tolist(),
+                 "displacement": [] if displacement is None else np.asarray(displacement, dtype=float).tolist(),
+                 "timings": timings or {}}
+        with self.lock:
+            with open(os.path.join(self.folder, pending_name), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.pending.append(entry)
+            if len(self.pending) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        # turn the pending evaluations into a new chunk, written aside and renamed once complete
+        if not self.pending:
+            return
+        entries = self.pending
+        folder = os.path.join(self.folder, "chunk_%05d" % len(self.chunks))
+        os.makedirs(folder + ".tmp", exist_ok=True)
+        for name, dtype in columns.items():
+            np.save(os.path.join(folder + ".tmp", name + ".npy"), np.array([entry[name] for entry in entries],
+                                                                           dtype=dtype))
+        lengths = [len(entry["energy"]) for entry in entries]
+        np.save(os.path.join(folder + ".tmp", "offset.npy"), np.concatenate(([0], np.cumsum(lengths))))
+        for name in ("energy", "displacement"):
+            np.save(os.path.join(folder + ".tmp", name + ".npy"),
+                    np.array([value for entry in entries for value in entry[name]], dtype=float))
+        with open(os.path.join(folder + ".tmp", "timings.json"), "w") as f:
+            json.dump([entry["timings"] for entry in entries], f)
+        os.replace(folder + ".tmp", folder)
+        os.remove(os.path.join(self.folder, pending_name))
+        self.chunks.append(Chunk(folder))
+        self.pending = []
+
+    def close(self):
+        with self.lock:
+            self.flush()
+
+    def locate(self, index):
+        # chunk (None for the pending evaluations) and row of an evaluation
+        for chunk in self.chunks:
+            if index < len(chunk):
+                return chunk, index
+            index -= len(chunk)
+        return None, index
+
+    def column(self, name):
+        # one column over all the evaluations, only this column is read from the chunks
+        parts = [np.asarray(chunk.data[name]) for chunk in self.chunks]
+        if self.pending:
+            parts.append(np.array([entry[name] for entry in self.pending], dtype=columns[name]))
+        if not parts:
+            return np.zeros((0, 4) if name == "x" else 0, dtype=columns[name])
+        return np.concatenate(parts)
+
+    def select(self, status=None, model=None, where=None):
+        # indices of the evaluations matching a status, a model hash and a condition on the columns,
+        # e.g. where=lambda c: c["x"][:, 0] > 1.0
+        keep = np.ones(len(self), dtype=bool)
+        if status is not None:
+            keep &= self.column("status") == status
+        if model is not None:
+            keep &= self.column("model") == model
+        if where is not None:
+            keep &= where(self)
+        return np.flatnonzero(keep)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def best(self, k=10, status="ok", model=None):
+        # indices of the k lowest objectives
+        index = self.select(status, model)
+        return index[np.argsort(self.column("objective")[index], kind="stable")[:k]]
+
+    def curve(self, index):
+        # energy and displacement of one evaluation, read from its chunk only
+        chunk, row = self.locate(index)
+        if chunk is None:
+            entry = self.pending[row]
+            return np.array(entry["energy"]), np.array(entry["displacement"])
+        return chunk.curve(row)
+
+    def curves(self, indices):
+        for index in indices:
+            yield self.curve(index)
+
+    def timings(self, index):
+        chunk, row = self.locate(index)
+        if chunk is None:
+            return self.pending[row]["timings"]
+        return chunk.timings()[row]
+
+
+def summary(folder="archive", best=10):
+    archive = Archive(folder)
+    status = archive.column("status")
+    print(str(len(archive)) + " evaluations in " + folder)
+    print("status: " + ", ".join(k + " " + str(v) for k, v in zip(*np.unique(status, return_counts=True))))
+    x, objective = archive.column("x"), archive.column("objective")
+    print("best evaluations:")
+    for index in archive.best(best):
+        print("  %10.5f  %s  %s" % (-objective[index], x[index].tolist(), archive.column("project")[index]))
+
+
+if __name__ == "__main__":
+    summary(*sys.argv[1:2])
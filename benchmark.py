@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import functions
+import inp_deck
+import parameters
+from analysis import barrier, barrier_batch
+from fake_abaqus import FakeLauncher, synthetic_curve, synthetic_curves
+
+# Benchmark of the optimisation pipeline without Abaqus, on the stand-in of fake_abaqus.py:
+#     - evaluations per hour and orchestration overhead per evaluation (wall time minus injected solver latency),
+#       through the real driver (functions.evaluate_status), with the CAE script path or the headless decks;
+#       an evaluation failing without an injected failure stops the benchmark,
+#     - post-processing throughput of the curve analysis, one curve at a time and as a batch,
+#     - meshing throughput of the input decks, meshed for every design or morphed from the template.
+# python benchmark.py --json bench.json                 save the figures
+# python benchmark.py --baseline bench.json             exit with 1 when a figure is worse than the baseline
+
+
+def bench_evaluations(curves, evaluations=40, workers=4, latency=0.2, failure_rate=0.05, headless=False, seed=0):
+    work_root = tempfile.mkdtemp(prefix="bench_")
+    saved = dict(functions.options), functions.run, parameters.headless
+    launcher = functions.run = FakeLauncher(curves, latency, failure_rate, seed)
+    functions.options.update(workers=workers, work_root=work_root, cache=None, surrogate=None, monitor=False,
+                             coarse=None, telemetry=None, curves=None, debug=False)
+    parameters.headless = headless
+    points = np.random.default_rng(seed).uniform([0.5, 0.01, 0.01, 0.01], [2.0, 0.99, 0.99, 0.99], (evaluations, 4))
+    cwd = os.getcwd()
+    os.chdir(work_root)  # the campaign Report.txt is written in the current directory
+    try:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(functions.evaluate_status, points.tolist()))
+        wall = time.time() - start
+    finally:
+        os.chdir(cwd)
+        functions.options.clear()
+        functions.options.update(saved[0])
+        functions.run = saved[1]
+        parameters.headless = saved[2]
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    # every failure comes from an injected one, a broken pipeline would otherwise look faster
+    statuses = {}
+    for result in results:
+        statuses[result[1]] = statuses.get(result[1], 0) + 1
+    print(("headless" if headless else "cae") + " evaluations: "
+          + ", ".join(k + " " + str(v) for k, v in sorted(statuses.items()))
+          + ", " + str(launcher.failures) + " injected failures")
+    if statuses.get("failed", 0) > launcher.failures:
+        raise RuntimeError(str(statuses.get("failed", 0) - launcher.failures) + " unexpected failed evaluations")
+
+    return {"evaluations_per_hour": evaluations / wall * 3600.0,
+            "overhead_per_evaluation": (wall * workers - launcher.injected) / evaluations}
+
+
+def bench_post_processing(count=2000, frames=200, seed=0):
+    rng = np.random.default_rng(seed)
+    stacked = [synthetic_curve(rng, frames) for k in range(count)]
+    energy = np.array([curve[0] for curve in stacked])
+    displacement = stacked[0][1]
+
+    start = time.time()
+    single = [barrier(e, displacement) for e in energy]
+    loop = time.time() - start
+    start = time.time()
+    batch = barrier_batch(energy, displacement)
+    vectorised = time.time() - start
+    assert np.allclose(single, batch)
+    return {"curves_per_second": count / loop, "batch_curves_per_second": count / vectorised}
+
+
+def bench_meshing(count=200, seed=0):
+    points = np.random.default_rng(seed).uniform([0.5, 0.01, 0.01, 0.01], [2.0, 0.99, 0.99, 0.99], (count, 4))
+    figures = {}
+    for name, template in (("meshes_per_second", False), ("template_meshes_per_second", True)):
+        start = time.time()
+        for x in points:
+            inp_deck.mesh(x, template=template)
+        figures[name] = count / (time.time() - start)
+    return figures
+
+
+def compare(figures, baseline, tolerance):
+    # names of the figures worse than the baseline by more than the tolerance
+    worse = []
+    for name, value in figures.items():
+        if name not in baseline:
+            continue
+        if name.startswith("overhead"):
+            if value > baseline[name] * (1 + tolerance) and value - baseline[name] > 0.05:
+                worse.append(name)
+        elif value < baseline[name] * (1 - tolerance):
+            worse.append(name)
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Abaqus-free benchmark of the optimisation pipeline")
+    parser.add_argument("--curves", help="folder of recorded curve .npz files, synthetic curves by default")
+    parser.add_argument("--evaluations", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="injected solver time per job, in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--json", help="file receiving the figures")
+    parser.add_argument("--baseline", help="figures of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    folder = None
+    if args.curves:
+        curves = sorted(os.path.join(os.path.abspath(args.curves), name) for name in os.listdir(args.curves)
+                        if name.endswith(".npz"))
+    else:
+        folder = tempfile.mkdtemp(prefix="curves_")
+        curves = synthetic_curves(folder)
+
+    figures = {}
+    for mode, headless in (("cae", False), ("headless", True)):
+        result = bench_evaluations(curves, args.evaluations, args.workers, args.latency, args.failure_rate, headless)
+        for name, value in result.items():
+            figures[mode + "_" + name] = value
+    figures.update(bench_post_processing())
+    figures.update(bench_meshing())
+    if folder is not None:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    for name, value in sorted(figures.items()):
+        print("%-36s %12.3f" % (name, value))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(figures, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            worse = compare(figures, json.load(f), args.tolerance)
+        if worse:
+            print("worse than the baseline: " + ", ".join(worse))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
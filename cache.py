@@ -0,0 +1,89 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+import parameters
+
+
+def model_hash(constants=None):
+    # hash of the fixed values of the model, so a change of mesh size or material starts a new cache
+    if constants is None:
+        constants = parameters.constants()
+    return hashlib.sha1(json.dumps(constants, sort_keys=True).encode("UTF-8")).hexdigest()
+
+
+class Cache:
+    # On-disk store of the evaluations, shared by all the workers and kept between the optimisation runs.
+    # A point is identified by its design vector rounded to `digits` decimals and by the hash of the model.
+
+    def __init__(self, path="cache.sqlite", digits=8, constants=None):
+        self.path = path
+        self.digits = digits
+        self.constants = parameters.constants() if constants is None else constants
+        self.model = model_hash(self.constants)
+        with closing(self.connect()) as db, db:
+            db.execute("CREATE TABLE IF NOT EXISTS evaluations ("
+                       "key TEXT PRIMARY KEY, model TEXT, x TEXT, objective REAL, status TEXT, "
+                       "elapsed REAL, created REAL, outputs TEXT)")
+            # caches created before the extra outputs were stored
+            if "outputs" not in [row[1] for row in db.execute("PRAGMA table_info(evaluations)")]:
+                db.execute("ALTER TABLE evaluations ADD COLUMN outputs TEXT")
+
+    def for_mesh(self, scale):
+        # cache of the same model meshed with elements `scale` times larger, stored in the same file
+        constants = dict(self.constants, size=self.constants["size"] * scale, size2=self.constants["size2"] * scale)
+        return Cache(self.path, self.digits, constants)
+
+    def connect(self):
+        # a new connection per call, so the cache can be used from several threads and processes
+        db = sqlite3.connect(self.path, timeout=60.0)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def key(self, x):
+        rounded = [round(float(xi), self.digits) + 0.0 for xi in x]  # + 0.0 turns -0.0 into 0.0
+        return self.model + ":" + json.dumps(rounded)
+
+    def get(self, x):
+        # failed runs (crash, license...) and runs stopped by the heuristics of the monitor are kept for the
+        # record but are computed again
+        with closing(self.connect()) as db:
+            row = db.execute("SELECT objective, status, elapsed, outputs FROM evaluations "
+                             "WHERE key = ? AND status NOT IN ('failed', 'terminated')", (self.key(x),)).fetchone()
+        if row is None:
+            return None
+        return {"objective": row[0], "status": row[1], "elapsed": row[2], "outputs": json.loads(row[3] or "{}")}
+
+    def put(self, x, objective, status, elapsed, outputs=None):
+        with closing(self.connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO evaluations "
+                       "(key, model, x, objective, status, elapsed, created, outputs) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (self.key(x), self.model, json.dumps([float(xi) for xi in x]), objective, status, elapsed,
+                        time.time(), json.dumps(outputs or {})))
+
+    def history(self, last=None):
+        # all the evaluations of the current model (the `last` ones only), in the order they were computed
+        with closing(self.connect()) as db:
+            if last is None:
+                rows = db.execute("SELECT x, objective, status, elapsed, outputs FROM evaluations WHERE model = ? "
+                                  "ORDER BY created", (self.model,)).fetchall()
+            else:
+                rows = db.execute("SELECT x, objective, status, elapsed, outputs FROM evaluations WHERE model = ? "
+                                  "ORDER BY created DESC LIMIT ?", (self.model, last)).fetchall()[::-1]
+        return [{"x": json.loads(row[0]), "objective": row[1], "status": row[2], "elapsed": row[3],
+                 "outputs": json.loads(row[4] or "{}")} for row in rows]
+
+    def version(self):
+        # number of evaluations of the current model and time of the last one, changed by every put
+        with closing(self.connect()) as db:
+            return tuple(db.execute("SELECT COUNT(*), MAX(created) FROM evaluations WHERE model = ?",
+                                    (self.model,)).fetchone())
+
+    def best(self, k=1):
+        # the k best successful evaluations, used to warm-start Nomad
+        with closing(self.connect()) as db:
+            rows = db.execute("SELECT x, objective FROM evaluations WHERE model = ? AND status = 'ok' "
+                              "ORDER BY objective LIMIT ?", (self.model, k)).fetchall()
+        return [{"x": json.loads(row[0]), "objective": row[1]} for row in rows]
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+import deck_check
+import functions
+from archive import Archive
+from cache import Cache
+from checkpoint import cleanup
+from doe import latin_hypercube
+from functions import complete, evaluate_status, options
+from parameters import lb, ub
+
+# Campaign of several Nomad runs sharing one pool of workers, the evaluation cache and a global budget:
+#     - multi-start: runs from different starting points and Nomad seeds,
+#     - multi-objective: each run minimises a weighted sum of normalised outputs (scalarisation sweep) among
+#       "objective" (-delta), "force" (peak reaction force) and "stroke" (displacement at snap-through); the
+#       Pareto front is then extracted from all the evaluations of the cache.
+# Every Nomad run is a separate process (Nomad keeps global state) sending its blocks of points to the
+# campaign, which evaluates them on the shared pool. A point requested by a run while another run computes
+# it waits for that evaluation instead of running twice.
+# The budget counts the Abaqus runs only, cache hits and screened points are free; once it is spent, the new
+# points are reported failed to Nomad right away so that the runs end quickly.
+# python campaign.py --starts 4 --budget 1000
+# python campaign.py --objectives objective force --weights 5 --budget 1000
+
+
+def run_instance(connection, x0, params):
+    # Nomad run in a child process, its blackbox asks the campaign for the outputs of every block
+    import PyNomad
+
+    def block(points):
+        xs = [[points.get_x(k).get_coord(i) for i in range(points.get_x(k).size())] for k in range(points.size())]
+        connection.send(xs)
+        values = connection.recv()
+        for k, value in enumerate(values):
+            if value is not None:
+                points.get_x(k).setBBO(str(value).encode("UTF-8"))
+        return [value is not None for value in values]
+
+    result = PyNomad.optimize(block, x0, lb, ub, params)
+    connection.send(None)
+    connection.send({name: result[name] for name in ("x_best", "f_best", "nb_evals") if name in result})
+
+
+def pareto(history, names, signs=None):
+    # indices of the successful evaluations not dominated on the `names` outputs, all minimised
+    # (a sign of -1 maximises an output)
+    signs = np.ones(len(names)) if signs is None else np.asarray(signs, dtype=float)
+    rows = [k for k, h in enumerate(history) if h["status"] == "ok"]
+    values = np.array([[value(history[k], name) for name in names] for k in rows]).reshape(len(rows), len(names))
+    values = values * signs
+    finite = np.all(np.isfinite(values), axis=1)
+    front = []
+    for k in np.flatnonzero(finite):
+        dominated = np.all(values[finite] <= values[k], axis=1) & np.any(values[finite] < values[k], axis=1)
+        if not np.any(dominated):
+            front.append(rows[k])
+    return front
+
+
+def value(evaluation, name):
+    # one output of an evaluation as given by the cache or evaluate_status
+    if name == "objective":
+        return evaluation["objective"]
+    return evaluation["outputs"].get(name, float('nan'))
+
+
+def scalarization(count):
+    # weights of a sweep between two objectives, the ends included
+    return [(1.0 - a, a) for a in np.linspace(0.0, 1.0, count)]
+
+
+class Campaign:
+
+    def __init__(self, budget=1000, workers=None, objectives=("objective",), scales=None):
+        self.budget = budget  # Abaqus runs of the whole campaign
+        self.spent = 0
+        self.objectives = objectives
+        self.outputs = tuple(name for name in objectives if name != "objective")  # needed from the cache
+        self.scales = scales or self.default_scales()
+        self.pool = ThreadPoolExecutor(max_workers=workers or options["workers"])
+        self.workers = workers or options["workers"]
+        self.running = {}  # key of a point -> future of its evaluation
+        self.charged = set()
+        self.lock = threading.Lock()
+
+    def default_scales(self):
+        # median magnitude of every output among the successful evaluations of the cache, 1 without any
+        history = options["cache"].history() if options["cache"] is not None else []
+        scales = {}
+        for name in self.objectives:
+            values = np.abs([value(h, name) for h in history if h["status"] == "ok"])
+            values = values[np.isfinite(values)]
+            scales[name] = float(np.median(values)) if len(values) and np.median(values) > 0 else 1.0
+        return scales
+
+    def submit(self, x):
+        key = json.dumps([round(float(xi), 8) + 0.0 for xi in x])
+        with self.lock:
+            if key in self.running:
+                return self.running[key]
+            free = options["cache"] is not None and complete(options["cache"].get(x), self.outputs)
+            if not free:
+                if self.spent >= self.budget:
+                    future = Future()
+                    future.set_result((float('inf'), "budget", {}))
+                    return future
+                self.spent += 1
+                self.charged.add(key)
+            future = self.pool.submit(evaluate_status, x, 1.0, self.outputs)
+            self.running[key] = future
+        future.add_done_callback(lambda done: self.finished(key, done))
+        return future
+
+    def finished(self, key, future):
+        with self.lock:
+            self.running.pop(key, None)
+            if key in self.charged:
+                self.charged.discard(key)
+                if future.exception() is None and future.result()[1] in ("cached", "screened"):
+                    self.spent -= 1  # no Abaqus run after all
+
+    def scalarize(self, result, weights):
+        objective, status, outputs = result
+        if status == "budget":
+            return None
+        if status not in ("ok", "cached") or not np.isfinite(objective):
+            return float('inf')
+        evaluation = {"objective": objective, "outputs": outputs}
+        total = sum(w * value(evaluation, name) / self.scales[name] for w, name in zip(weights, self.objectives))
+        return total if np.isfinite(total) else float('inf')
+
+    def serve(self, connection, weights, results, k):
+        # evaluate the blocks of one Nomad run until it is over
+        while True:
+            points = connection.recv()
+            if points is None:
+                results[k] = connection.recv()
+                return
+            values = []
+            for future in [self.submit(x) for x in points]:
+                try:
+                    values.append(self.scalarize(future.result(), weights))
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    values.append(None)
+            connection.send(values)
+
+    def optimize(self, starts, weights=None, seeds=None):
+        # one Nomad run per starting point, with its weights of the objectives and its Nomad seed
+        weights = weights or [(1.0,) * len(self.objectives)] * len(starts)
+        if any(len(w) != len(self.objectives) for w in weights):
+            raise ValueError("one weight per objective expected, objectives: " + ", ".join(self.objectives))
+        seeds = seeds or list(range(len(starts)))
+        results = [None] * len(starts)
+        threads, processes = [], []
+        for k, x0 in enumerate(starts):
+            params = functions.nomad_params(x0, self.workers, self.budget, "Blackbox_result_" + str(k) + ".txt")
+            params.append("SEED " + str(seeds[k]))
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_instance, args=(child, list(x0), params), daemon=True)
+            process.start()
+            thread = threading.Thread(target=self.serve, args=(parent, weights[k], results, k), daemon=True)
+            thread.start()
+            threads.append(thread)
+            processes.append(process)
+        for thread, process in zip(threads, processes):
+            thread.join()
+            process.join()
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-start and multi-objective Nomad campaign")
+    parser.add_argument("--starts", type=int, default=4, help="Nomad runs, one per starting point")
+    parser.add_argument("--budget", type=int, default=1000, help="Abaqus runs of the whole campaign")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--objectives", nargs="+", default=["objective"], choices=["objective", "force", "stroke"])
+    parser.add_argument("--weights", type=int, default=0, help="scalarisation sweep of two objectives, one run "
+                                                               "per weight")
+    args = parser.parse_args()
+    if args.weights and len(args.objectives) != 2:
+        parser.error("--weights sweeps between exactly two objectives")
+
+    functions.set_constants({"headless": args.headless})  # before the cache, the mesher is part of the model hash
+    if args.headless:
+        deck_check.require()  # before any evaluation, the decks must match the references
+    options.update(workers=args.workers, monitor=True, telemetry="telemetry.jsonl", cache=Cache("cache.sqlite"),
+                   archive=Archive("archive"))
+    cleanup(options["work_root"], functions.run)  # work directories of a campaign that died
+    weights = scalarization(args.weights) if args.weights else None
+    count = len(weights) if weights else args.starts
+
+    # starting points: the best designs already computed, completed by a Latin hypercube
+    starts = [b["x"] for b in options["cache"].best(count)]
+    starts += latin_hypercube(count - len(starts), lb, ub).tolist() if count > len(starts) else []
+
+    campaign = Campaign(args.budget, args.workers, tuple(args.objectives))
+    for k, result in enumerate(campaign.optimize(starts, weights)):
+        print("run " + str(k) + ": " + str(result))
+    campaign.close()
+    options["archive"].close()
+    print(str(campaign.spent) + " Abaqus runs")
+
+    history = options["cache"].history()
+    if len(args.objectives) > 1:
+        print("Pareto front:")
+        for k in pareto(history, args.objectives):
+            print("  " + str(history[k]["x"]) + "  " + str([value(history[k], name) for name in args.objectives]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+
+# Crash-safe optimisation runs. Every output handed to Nomad is logged as soon as it is known, so a run
+# stopped by a reboot or a license failure is resumed by starting Nomad again with the same settings:
+# Nomad proposes the same points, they get the same outputs from the log at once (counted by Nomad, not run
+# again) and the run goes on from the first point that was not finished.
+#     - checkpoint.json keeps the settings of the run in progress (x0, parameters) until it is over,
+#     - replay.jsonl keeps every output handed to Nomad, keyed by point, the screened, terminated and failed
+#       evaluations included: the cache does not keep them all, and the surrogate screening depends on the cache
+#       and on the timing of the workers, so the resumed run is answered from this log to follow the same path,
+#     - every work directory holds an owner.json (driver process, host, design, project), so that the
+#       directories left by a dead driver are found, their Abaqus jobs terminated and the files removed.
+
+name = "checkpoint.json"
+owner_name = "owner.json"
+replay_name = "replay.jsonl"
+
+
+def write_json(path, data):
+    # write to a temporary file first, a crash never leaves a half-written file
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def claim(folder, x, project):
+    # record the evaluation running in a work directory
+    write_json(os.path.join(folder, owner_name), {"pid": os.getpid(), "host": socket.gethostname(), "x": list(x),
+                                                  "project": project, "started": time.time()})
+
+
+def alive(pid):
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def orphans(work_root, grace=600.0):
+    # work directories of drivers that are not running any more on this host; a directory without owner
+    # (driver killed right after creating it) is an orphan once older than `grace` seconds
+    found = []
+    for folder in sorted(glob.glob(os.path.join(work_root, "*"))):
+        if not os.path.isdir(folder):
+            continue
+        path = os.path.join(folder, owner_name)
+        if not os.path.exists(path):
+            if time.time() - os.path.getmtime(folder) > grace:
+                found.append((folder, None))
+            continue
+        try:
+            with open(path, "r") as f:
+                owner = json.load(f)
+        except ValueError:
+            found.append((folder, None))
+            continue
+        if owner["host"] == socket.gethostname() and owner["pid"] != os.getpid() and not alive(owner["pid"]):
+            found.append((folder, owner))
+    return found
+
+
+def cleanup(work_root, run=None, keep=False):
+    # terminate the Abaqus jobs still running in the orphaned directories (lock file present) and remove them;
+    # `run` is functions.run, `keep` leaves the files for inspection
+    found = orphans(work_root) if os.path.isdir(work_root) else []
+    for folder, owner in found:
+        print("orphaned evaluation: " + folder + ("" if owner is None else " x=" + str(owner["x"])))
+        if run is not None:
+            for lock in glob.glob(os.path.join(folder, "*.lck")):
+                job = os.path.splitext(os.path.basename(lock))[0]
+                run("abaqus terminate job=" + job, cwd=folder)
+        if not keep:
+            shutil.rmtree(folder, ignore_errors=True)
+    return found
+
+
+class Replay:
+    # outputs handed to Nomad during the run in progress: point -> (output, evaluation reported successful)
+
+    def __init__(self, path=replay_name, digits=12):
+        self.path = path
+        self.digits = digits
+        self.outputs = {}
+        self.lock = threading.Lock()
+
+    def key(self, x):
+        return json.dumps([round(float(xi), self.digits) + 0.0 for xi in x])
+
+    def load(self):
+        self.outputs = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # last line cut by a crash
+                        break
+                    self.outputs[entry["key"]] = (entry["output"], entry["ok"])
+
+    def clear(self):
+        with self.lock:
+            self.outputs = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def get(self, x):
+        return self.outputs.get(self.key(x))
+
+    def put(self, x, output, ok):
+        key = self.key(x)
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "output": output, "ok": ok}) + "\n")
+            self.outputs[key] = (output, ok)
+
+
+class Checkpoint:
+
+    def __init__(self, path=name, replay=None):
+        self.path = path
+        self.replay = replay or Replay(os.path.join(os.path.dirname(path), replay_name))
+
+    def pending(self):
+        # state of the unfinished run, None when there is none
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        return None if state["finished"] else state
+
+    def start(self, x0, params, cache=None):
+        # settings of the run to carry out: those of the unfinished run if any, so that Nomad replays it with the
+        # outputs of the replay log
+        state = self.pending()
+        if state is not None:
+            self.replay.load()
+            done = len(cache.history()) if cache is not None else 0
+            print("resuming the run started at " + time.ctime(state["started"]) + ", " + str(len(self.replay.outputs))
+                  + " outputs to replay, " + str(done) + " evaluations in the cache")
+            return state["x0"], state["params"]
+        self.replay.clear()
+        write_json(self.path, {"x0": list(x0), "params": list(params), "started": time.time(), "finished": False})
+        return x0, params
+
+    def finish(self, result=None):
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        state["finished"] = True
+        state["result"] = {k: v for k, v in (result or {}).items() if k in ("x_best", "f_best", "nb_evals")}
+        write_json(self.path, state)
@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import parameters
+from inp_deck import write_deck
+
+# Checks of the input decks of inp_deck for the design x0 of optim_file.py, under the model settings recorded
+# with the reference (reference_decks/deck_x0.json), whatever the settings of the campaign:
+#     - snapshot, without Abaqus: the deck written now must be the same text as reference_decks/deck_x0.inp, the
+#       output of this writer when the snapshot was taken; a change of the writer shows as a difference,
+#     - CAE reference, once reference_decks/cae_x0.inp is exported from the CAE model (fem_model.model): the two
+#       meshes differ, so the decks are compared on what the models must share:
+#         - the node sets carrying every boundary condition (block and force vertices, symmetry edges), by position,
+#         - the materials, the shell thicknesses and the area of the hard and soft regions,
+#         - the element family, the step procedure and the loading.
+# The headless path refuses to run when a comparison fails; without the CAE export it runs on the snapshot alone.
+# Export of the CAE reference, in reference_decks: abaqus cae noGUI=export_reference.py
+# Check: python deck_check.py               check, and take a new snapshot with --update (matching the CAE export)
+
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_decks")
+x0 = [1.0, 0.1, 0.5, 0.9]
+setting_names = ("n", "r_ext", "r_int", "size", "size2", "quadratic", "hyperelastic", "hard_mat", "soft_mat",
+                 "c_coefficient", "template_mesh")
+checked = None  # differences found by require(), checked once per process
+check_lock = threading.Lock()
+
+
+def keyword(line):
+    # "*Nset, nset=block, generate" -> ("nset", {"nset": "block", "generate": ""})
+    words = [word.strip() for word in line[1:].split(",")]
+    params = {}
+    for word in words[1:]:
+        name, _, text = word.partition("=")
+        if name:
+            params[name.strip().lower()] = text.strip()
+    return words[0].lower(), params
+
+
+def set_name(text):
+    # "base.force" (instance set of the CAE export) -> "force"
+    return text.strip().lower().split(".")[-1]
+
+
+def read_deck(path):
+    # the parts of an input deck compared by compare_decks, the boundary conditions of the first step only
+    deck = {"nodes": {}, "elements": {}, "types": {}, "nset": {}, "elset": {}, "materials": {}, "sections": {},
+            "boundary": [], "step": None, "dynamic": None}
+    current, params, material, section, steps = None, {}, None, None, 0
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("**"):
+                continue
+            if line.startswith("*"):
+                current, params = keyword(line)
+                if current == "material":
+                    material = params["name"].lower()
+                    deck["materials"][material] = {}
+                elif current == "shell section":
+                    section = set_name(params["elset"])
+                    deck["sections"][section] = [params["material"].lower(), None]
+                elif current == "step":
+                    steps += 1
+                    if steps == 1:
+                        deck["step"] = {k: v.upper() for k, v in params.items() if k in ("nlgeom", "inc")}
+                elif current in ("nset", "elset"):
+                    deck[current].setdefault(set_name(params[current]), set())
+                continue
+            values = [value.strip() for value in line.split(",") if value.strip()]
+            if current == "node":
+                deck["nodes"][int(values[0])] = [float(value) for value in values[1:4]] + [0.0] * (4 - len(values))
+            elif current == "element":
+                label = int(values[0])
+                deck["elements"][label] = [int(value) for value in values[1:]]
+                deck["types"][label] = params["type"].upper()
+                if "elset" in params:
+                    deck["elset"].setdefault(set_name(params["elset"]), set()).add(label)
+            elif current in ("nset", "elset"):
+                labels = deck[current][set_name(params[current])]
+                if "generate" in params:
+                    first, last, step = [int(value) for value in values[:3]]
+                    labels.update(range(first, last + 1, step))
+                else:
+                    labels.update(int(value) for value in values if value.isdigit())  # names of other sets ignored
+            elif current in ("density", "elastic", "hyperelastic"):
+                deck["materials"][material][current] = [float(value) for value in values]
+            elif current == "shell section" and deck["sections"][section][1] is None:
+                deck["sections"][section][1] = float(values[0])
+            elif current == "boundary" and steps == 1:
+                first = int(values[1])
+                last = int(values[2]) if len(values) > 2 else first
+                deck["boundary"].append((set_name(values[0]), first, last, float(values[3]) if len(values) > 3
+                                         else 0.0))
+            elif current == "dynamic" and steps == 1 and deck["dynamic"] is None:
+                deck["dynamic"] = [float(value) for value in values]
+    return deck
+
+
+def supports(deck):
+    # boundary conditions of every node set: set -> sorted (first dof, last dof, value)
+    found = {}
+    for name, first, last, value in deck["boundary"]:
+        found.setdefault(name, []).append((first, last, value))
+    return {name: sorted(bcs) for name, bcs in found.items()}
+
+
+def extent(deck, name):
+    # bounding box of the nodes of a set
+    xyz = np.array([deck["nodes"][label] for label in deck["nset"].get(name, ()) if label in deck["nodes"]])
+    return np.concatenate((xyz.min(axis=0), xyz.max(axis=0))) if len(xyz) else None
+
+
+def area(deck, name):
+    # area of the elements of a set, the quadrilaterals split in two triangles
+    total = 0.0
+    for label in deck["elset"].get(name, ()):
+        xyz = np.array([deck["nodes"][node] for node in deck["elements"][label]])
+        for k in range(1, len(xyz) - 1):
+            total += 0.5 * np.linalg.norm(np.cross(xyz[k] - xyz[0], xyz[k + 1] - xyz[0]))
+    return total
+
+
+def close(a, b, tolerance):
+    return len(a) == len(b) and np.allclose(a, b, rtol=tolerance, atol=0.0)
+
+
+def compare_decks(deck, reference, tolerance=0.02):
+    # differences of a deck to a reference deck of the same design, [] when they describe the same model;
+    # positions are compared to tolerance * r_ext, areas and values relatively
+    differences = []
+    scale = tolerance * parameters.r_ext
+
+    bcs = supports(deck)
+    for name, expected in supports(reference).items():
+        box = extent(reference, name)
+        matches = [other for other, found in bcs.items()
+                   if len(found) == len(expected) and all(a[:2] == b[:2] and abs(a[2] - b[2]) <= scale
+                                                          for a, b in zip(found, expected))]
+        if not matches:
+            differences.append("no node set with the boundary conditions " + str(expected) + " of " + name)
+        elif not any(box is not None and extent(deck, other) is not None
+                     and np.max(np.abs(extent(deck, other) - box)) <= scale for other in matches):
+            differences.append("boundary conditions " + str(expected) + " of " + name + " applied at "
+                               + str([extent(deck, other).round(3).tolist() for other in matches]) + ", expected at "
+                               + str(None if box is None else box.round(3).tolist()))
+
+    for name, expected in reference["materials"].items():
+        found = deck["materials"].get(name)
+        if found is None or sorted(found) != sorted(expected) or \
+                not all(close(found[k], expected[k], 1e-6) for k in expected):
+            differences.append("material " + name + ": " + str(found) + ", expected " + str(expected))
+
+    regions = {material: (thickness, area(reference, elset))
+               for elset, (material, thickness) in reference["sections"].items()}
+    for elset, (material, thickness) in deck["sections"].items():
+        if material not in regions:
+            differences.append("section of " + elset + " with the material " + material + " not in the reference")
+            continue
+        expected, expected_area = regions.pop(material)
+        if not close([thickness], [expected], 1e-6):
+            differences.append("thickness of " + material + ": " + str(thickness) + ", expected " + str(expected))
+        if not close([area(deck, elset)], [expected_area], tolerance):
+            differences.append("area of " + material + ": %.4g, expected %.4g" % (area(deck, elset), expected_area))
+    for material in regions:
+        differences.append("no section with the material " + material)
+
+    # S3 of the degenerate corner of the wedge, the CAE mesher may close it with S4 only
+    extra = set(deck["types"].values()) - set(reference["types"].values()) - {"S3"}
+    if extra:
+        differences.append("element types " + str(sorted(extra)) + " not in the reference")
+    if deck["step"] != reference["step"]:
+        differences.append("step " + str(deck["step"]) + ", expected " + str(reference["step"]))
+    if deck["dynamic"] is None or reference["dynamic"] is None or \
+            not close(deck["dynamic"], reference["dynamic"], 1e-6):
+        differences.append("dynamic step " + str(deck["dynamic"]) + ", expected " + str(reference["dynamic"]))
+    return differences
+
+
+@contextmanager
+def settings(values):
+    # model settings of parameters.py replaced for the time of the block
+    saved = {name: getattr(parameters, name) for name in values}
+    for name, value in values.items():
+        setattr(parameters, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(parameters, name, value)
+
+
+def check(update=False):
+    # differences of the deck written now for x0 to the snapshot and to the CAE export when there is one;
+    # `update` takes a new snapshot with the current settings instead
+    cae_path, deck_path = os.path.join(folder, "cae_x0.inp"), os.path.join(folder, "deck_x0.inp")
+    settings_path = os.path.join(folder, "deck_x0.json")
+    if update or not os.path.exists(settings_path):
+        values = {name: getattr(parameters, name) for name in setting_names}
+    else:
+        with open(settings_path, "r") as f:
+            values = json.load(f)
+    handle, path = tempfile.mkstemp(suffix=".inp")
+    os.close(handle)
+    try:
+        with settings(values):
+            write_deck(path, x0, -0.8 * parameters.r_ext)
+            differences = compare_decks(read_deck(path), read_deck(cae_path)) if os.path.exists(cae_path) else []
+        with open(path, "r") as f:
+            text = f.read()
+    finally:
+        os.remove(path)
+    if update and not differences:
+        with open(deck_path, "w") as f:
+            f.write(text)
+        with open(settings_path, "w") as f:
+            json.dump(values, f, indent=1)
+    elif not os.path.exists(deck_path) or not os.path.exists(settings_path):
+        differences.append("no snapshot " + deck_path + ", take it with: python deck_check.py --update")
+    else:
+        with open(deck_path, "r") as f:
+            if f.read() != text:
+                differences.append("the deck written for x0 differs from the snapshot " + deck_path)
+    return differences
+
+
+def require():
+    # raise when the input decks differ from the snapshot or from the CAE reference, checked once per process
+    global checked
+    with check_lock:
+        if checked is None:
+            checked = check()
+            if not os.path.exists(os.path.join(folder, "cae_x0.inp")):
+                print("input decks checked against the snapshot only, no CAE reference in " + folder)
+    if checked:
+        raise RuntimeError("input decks not matching the references:\n    " + "\n    ".join(checked))
+
+
+if __name__ == "__main__":
+    found = check("--update" in sys.argv[1:])
+    cae = os.path.exists(os.path.join(folder, "cae_x0.inp"))
+    print("\n".join(found) if found else "the input decks match the snapshot" + (" and the CAE reference" if cae
+                                                                                 else ", no CAE reference yet"))
+    sys.exit(1 if found else 0)
@@ -0,0 +1,154 @@
+import argparse
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import deck_check
+import functions
+from archive import Archive
+from cache import Cache
+from checkpoint import cleanup
+from functions import evaluate_status, options
+from parameters import lb, ub
+
+# Design of experiments over the waterbomb blackbox, to map the bistability landscape:
+#     - Latin hypercube, Sobol (needs scipy) or full-factorial designs between lb and ub,
+#     - run through the same evaluation as Nomad (cache, monitor, archive) by a pool of workers,
+#     - every result is appended to a JSON lines file; a sweep started again skips the points already in it,
+#       except the failed ones (crash, license...) and the ones terminated by the monitor,
+#     - optional sweep over fixed constants of parameters.py (n, r_ext, hard_mat...), full factorial,
+#     - the best points of the design can seed several Nomad runs.
+# python doe.py lhs 200 --seed 1 --constant n=4,6 --starts 3 --budget 200
+
+write_lock = threading.Lock()
+
+
+def latin_hypercube(count, lb, ub, seed=0):
+    # one point in every one of the `count` strata of each variable, strata paired at random
+    rng = np.random.default_rng(seed)
+    strata = np.array([rng.permutation(count) for k in range(len(lb))]).T
+    unit = (strata + rng.uniform(size=strata.shape)) / count
+    return np.asarray(lb) + unit * (np.asarray(ub) - np.asarray(lb))
+
+
+def sobol(count, lb, ub, seed=0):
+    from scipy.stats import qmc  # optional, only for this design
+    unit = qmc.Sobol(len(lb), scramble=True, seed=seed).random(count)
+    return qmc.scale(unit, lb, ub)
+
+
+def factorial(levels, lb, ub):
+    # full grid with `levels` values per variable (an int, or one int per variable), bounds included
+    levels = [levels] * len(lb) if np.isscalar(levels) else levels
+    axes = [np.linspace(low, high, level) for low, high, level in zip(lb, ub, levels)]
+    return np.array(list(itertools.product(*axes)))
+
+
+def design(method, count, lb, ub, seed=0):
+    if method == "lhs":
+        return latin_hypercube(count, lb, ub, seed)
+    if method == "sobol":
+        return sobol(count, lb, ub, seed)
+    if method == "factorial":
+        return factorial(count, lb, ub)
+    raise ValueError("unknown design: " + method)
+
+
+def key(x, digits=8):
+    # a point of a sweep, together with the constants it was computed with
+    return json.dumps([[round(float(xi), digits) + 0.0 for xi in x], sorted(options["constants"].items())])
+
+
+def load(path):
+    # results of the sweep file, a line cut by a crash is ignored
+    done = []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    done.append(json.loads(line))
+                except ValueError:
+                    pass
+    return done
+
+
+def sweep(points, path="doe.jsonl", workers=None):
+    # evaluate the points of a design that are not in the sweep file yet
+    done = {r["key"] for r in load(path) if r["status"] not in ("failed", "terminated")}
+    todo = [x for x in np.asarray(points).tolist() if key(x) not in done]
+    print(str(len(points) - len(todo)) + " points already done, " + str(len(todo)) + " to evaluate")
+    with ThreadPoolExecutor(max_workers=workers or options["workers"]) as pool:
+        futures = {pool.submit(evaluate_status, x): x for x in todo}
+        for future in as_completed(futures):
+            x = futures[future]
+            try:
+                objective, status, outputs = future.result()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                continue
+            result = {"x": x, "key": key(x), "constants": options["constants"], "objective": objective,
+                      "status": status, "outputs": outputs}
+            with write_lock:
+                with open(path, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+def best(path="doe.jsonl", k=5):
+    # the k best finite results of the sweep file for the current constants
+    results = [r for r in load(path) if r["constants"] == options["constants"] and np.isfinite(r["objective"])]
+    return [r["x"] for r in sorted(results, key=lambda r: r["objective"])[:k]]
+
+
+def starts(points, budget=200, workers=None):
+    # one Nomad run from each point, the evaluations shared through the cache
+    import PyNomad
+    workers = workers or options["workers"]
+    for k, x0 in enumerate(points):
+        params = functions.nomad_params(x0, workers, budget, stats_file="Blackbox_result_" + str(k) + ".txt")
+        PyNomad.optimize(functions.bb_pynomad_block, x0, lb, ub, params)
+
+
+def constant_sets(specification):
+    # ["n=4,6", "r_ext=10"] -> [{"n": 4, "r_ext": 10}, {"n": 6, "r_ext": 10}]
+    names, values = [], []
+    for item in specification:
+        name, text = item.split("=", 1)
+        names.append(name)
+        values.append([json.loads(value) for value in text.split(",")])
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Design of experiments over the waterbomb blackbox")
+    parser.add_argument("method", choices=["lhs", "sobol", "factorial"])
+    parser.add_argument("count", type=int, help="number of points, levels per variable for factorial")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="doe.jsonl")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--constant", action="append", default=[], help="NAME=V1,V2 fixed value(s) of the model")
+    parser.add_argument("--starts", type=int, default=0, help="Nomad runs seeded from the best points")
+    parser.add_argument("--budget", type=int, default=200, help="evaluations of every Nomad run")
+    args = parser.parse_args()
+
+    points = design(args.method, args.count, lb, ub, args.seed)
+    options.update(workers=args.workers, monitor=True, telemetry="telemetry.jsonl", archive=Archive("archive"))
+    functions.set_constants({"headless": args.headless})
+    if args.headless:
+        deck_check.require()  # before any evaluation, the decks must match the references
+    cleanup(options["work_root"], functions.run)  # work directories of a sweep that died
+    for constants in constant_sets(args.constant):
+        functions.set_constants(constants)
+        options["cache"] = Cache("cache.sqlite")  # after the constants, they are part of the model hash
+        sweep(points, args.output, args.workers)
+        if args.starts:
+            starts(best(args.output, args.starts), args.budget, args.workers)
+    options["archive"].close()
+
+
+if __name__ == "__main__":
+    main()
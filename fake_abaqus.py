@@ -0,0 +1,207 @@
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+from results import load_curve
+
+# Stand-in for Abaqus, to run and time the whole pipeline on a machine without it (see benchmark.py):
+#     - install() registers fake "abaqus", "part", "mesh"... modules, so that fem_model.model and
+#       post_process.post_process run unchanged; the jobs sleep and the odb replays a recorded energy curve,
+#     - FakeLauncher replaces functions.run: it executes Launch.py with the fake modules in a python subprocess
+#       ("abaqus cae nogui=...") or writes the .dat file of a headless job ("abaqus job=..."), after an
+#       injected solver latency, and fails a given fraction of the runs.
+# The curves are curve.npz files as written by post_process (options["curves"]), or synthetic ones.
+
+here = os.path.dirname(os.path.abspath(__file__))
+latency_name = "injected_latency.txt"  # solver latency injected by the jobs of a fake CAE run
+
+module_names = ['abaqus', 'abaqusConstants', 'part', 'material', 'section', 'assembly', 'step', 'interaction', 'load',
+                'mesh', 'optimization', 'job', 'sketch', 'visualization', 'connectorBehavior']
+
+constant_names = ['ANALYSIS', 'COUNTERCLOCKWISE', 'CYLINDRICAL', 'DEFAULT', 'DEFORMABLE_BODY', 'DEFORMED', 'FINER',
+                  'FROM_SECTION', 'GRADIENT', 'ISOTROPIC', 'LAST_INCREMENT', 'MIDDLE_SURFACE', 'NEO_HOOKE',
+                  'NO_IDEALIZATION', 'ODB', 'OFF', 'ON', 'PERCENTAGE', 'QUAD', 'QUASI_STATIC', 'RAMP', 'RIGHT', 'S3',
+                  'S4', 'S8R', 'SET', 'SIDE1', 'SIMPSON', 'SINGLE', 'STANDARD', 'STANDARD_EXPLICIT', 'STRI65',
+                  'STRUCTURED', 'THREE_D', 'UNIFORM', 'UNSET', 'VOLUMETRIC_DATA', 'YAXIS']
+
+
+class Anything:
+    # accepts every attribute, call, index and deletion of the CAE modelling API
+    id = 0
+
+    def __getattr__(self, name):
+        return Anything()
+
+    def __call__(self, *args, **kwargs):
+        return Anything()
+
+    def __getitem__(self, key):
+        return Anything()
+
+    def __delitem__(self, key):
+        pass
+
+    def __iter__(self):
+        return iter(())
+
+    def keys(self):
+        return []
+
+
+class FakeKeywordBlock:
+    # keyword blocks of the steps of the model, edited by fem_model.energy_print
+
+    def __init__(self):
+        self.sieBlocks = ['*Heading', '*Step, name=Analysis, nlgeom=YES, inc=10000', '*End Step',
+                          '*Step, name=Reverse, nlgeom=YES, inc=10000', '*End Step']
+
+    def synchVersions(self, storeNodesAndElements=True):
+        pass
+
+    def insert(self, position, text):
+        self.sieBlocks.insert(position + 1, text)
+
+
+class FakeModel(Anything):
+
+    def __init__(self):
+        self.keywordBlock = FakeKeywordBlock()
+
+
+class FakeJob(Anything):
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def submit(self):
+        pass
+
+    def waitForCompletion(self):
+        time.sleep(self.latency)
+        with open(latency_name, "a") as f:  # read back by FakeLauncher
+            f.write(repr(self.latency) + "\n")
+
+
+class FakeOdb(Anything):
+    # odb of the replayed curve, one frame per point of the history
+
+    def __init__(self, energy, displacement):
+        output = types.SimpleNamespace(data=list(zip(displacement, energy)))
+        region = types.SimpleNamespace(historyOutputs={'ALLSE': output})
+        frames = [types.SimpleNamespace(frameValue=value) for value in displacement]
+        step = types.SimpleNamespace(historyRegions={'Assembly ASSEMBLY': region}, frames=frames)
+        self.steps = {'Analysis': step, 'Reverse': step}
+
+    def close(self):
+        pass
+
+
+def install(curve_path, latency):
+    energy, displacement = load_curve(curve_path)
+    mdb = Anything()
+    mdb.Job = lambda **kwargs: FakeJob(latency)
+    mdb.Model = lambda **kwargs: FakeModel()
+    mdb.saveAs = lambda *args, **kwargs: None
+    session = Anything()
+    session.openOdb = lambda *args, **kwargs: FakeOdb(energy, displacement)
+    for name in module_names:
+        module = types.ModuleType(name)
+        for constant in constant_names:
+            setattr(module, constant, constant)
+        module.ElemType = Anything()
+        module.mdb = mdb
+        module.session = session
+        sys.modules[name] = module
+
+
+def synthetic_curve(rng, frames=200):
+    # energy of a loading path with a snap-through well at a random position and depth
+    displacement = np.linspace(0.0, 1.0, frames)
+    centre, width, depth = rng.uniform(0.3, 0.8), rng.uniform(0.03, 0.15), rng.uniform(0.0, 2.0)
+    energy = 1.0 + 3.0 * displacement ** 2 - depth * np.exp(-((displacement - centre) / width) ** 2)
+    return energy - energy[0], displacement
+
+
+def synthetic_curves(folder, count=50, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    for k in range(count):
+        energy, displacement = synthetic_curve(rng)
+        np.savez_compressed(os.path.join(folder, "synthetic_%04d.npz" % k), energy=energy, displacement=displacement)
+    return sorted(glob.glob(os.path.join(folder, "*.npz")))
+
+
+def write_dat(path, inp_path, energy, displacement):
+    # .dat of a headless job: energy of every increment and final coordinates of the nodes of the deck
+    nodes, reading = [], False
+    with open(inp_path, "r") as f:
+        for line in f:
+            if line.startswith("*"):
+                reading = line.lower().startswith("*node") and not line.lower().startswith("*node print")
+            elif reading:
+                nodes.append(line)
+    with open(path, "w") as f:
+        for time_value, energy_value in zip(displacement[1:], energy[1:]):
+            f.write(" STEP TIME COMPLETED       %.6E,  TOTAL TIME COMPLETED        %.6E\n" % (time_value, time_value))
+            f.write("   RECOVERABLE STRAIN ENERGY                 %.6E\n" % energy_value)
+        f.write("                                       N O D E   O U T P U T\n")
+        for line in nodes:
+            f.write("  " + "  ".join(value.strip() for value in line.split(",")) + "\n")
+        f.write(" MAXIMUM\n")
+
+
+class FakeLauncher:
+
+    def __init__(self, curves, latency=0.0, failure_rate=0.0, seed=0):
+        self.curves = [os.path.abspath(curve) for curve in curves]  # the jobs run in their work directory
+        self.latency = latency  # seconds per Abaqus job, two jobs per evaluation
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.injected = 0.0  # seconds of solver latency injected so far
+        self.failures = 0  # injected failures, each one ends its evaluation
+
+    def inject(self, seconds):
+        time.sleep(seconds)
+        with self.lock:
+            self.injected += seconds
+
+    def __call__(self, cmd, cwd=None, slot=None):
+        words = cmd.split()
+        with self.lock:
+            curve = self.curves[self.rng.integers(len(self.curves))]
+            failed = self.rng.random() < self.failure_rate
+        if "terminate" in words:
+            return subprocess.CompletedProcess(words, 0, b"", b"")
+        if failed:
+            with self.lock:
+                self.failures += 1
+            self.inject(self.latency)
+            return subprocess.CompletedProcess(words, 1, b"", b"injected failure")
+
+        if words[1] == "cae":
+            script = ("import sys; sys.path.insert(0, %r); import fake_abaqus; fake_abaqus.install(%r, %r); "
+                      "exec(compile(open('Launch.py').read(), 'Launch.py', 'exec'))" % (here, curve, self.latency))
+            completed = subprocess.run([sys.executable, "-c", script], capture_output=True, cwd=cwd)
+            path = os.path.join(cwd or ".", latency_name)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    seconds = sum(float(line) for line in f if line.strip())
+                with self.lock:
+                    self.injected += seconds
+            return completed
+
+        job = words[1][len("job="):]
+        self.inject(self.latency)
+        energy, displacement = load_curve(curve)
+        write_dat(os.path.join(cwd, job + ".dat"), os.path.join(cwd, job + ".inp"), energy, displacement)
+        with open(os.path.join(cwd, job + ".inp"), "r") as f:
+            if "*Restart, write" in f.read():
+                open(os.path.join(cwd, job + ".res"), "w").close()
+        return subprocess.CompletedProcess(words, 0, b"", b"")
@@ -13,12 +13,146 @@ from sketch import *
 from visualization import *
 from connectorBehavior import *
 
+import os
+
 import numpy as np
 
+import parameters
+from result_file import stop_name
+from telemetry import stamp
+
+
+def materials(m, hard_mat, soft_mat, c_coefficient, hyperelastic):
+    m.Material(name='hard')
+    m.materials['hard'].Density(
+        table=((1.04e-09,),))
+    m.materials['hard'].Elastic(
+        table=((hard_mat, 0.35),))
+
+    m.Material(name='soft')
+    m.materials['soft'].Density(
+        table=((1.2e-09,),))
+    if not hyperelastic:
+        m.materials['soft'].Elastic(
+            table=((soft_mat, 0.45),))
+    else:
+        m.materials['soft'].Hyperelastic(materialType=ISOTROPIC, table=((c_coefficient, 0.0),), testData=OFF,
+                                         type=NEO_HOOKE, volumetricResponse=VOLUMETRIC_DATA)
+
+
+def sections(m, rel_depth):
+    m.HomogeneousShellSection(idealization=NO_IDEALIZATION,
+                              integrationRule=SIMPSON,
+                              material='hard',
+                              name='hard',
+                              nodalThicknessField='',
+                              numIntPts=5,
+                              poissonDefinition=DEFAULT,
+                              preIntegrate=OFF,
+                              temperature=GRADIENT,
+                              thickness=0.1,
+                              thicknessField='',
+                              thicknessModulus=None,
+                              thicknessType=UNIFORM,
+                              useDensity=OFF)
+
+    m.HomogeneousShellSection(idealization=NO_IDEALIZATION,
+                              integrationRule=SIMPSON,
+                              material='soft',
+                              name='soft',
+                              nodalThicknessField='',
+                              numIntPts=5,
+                              poissonDefinition=DEFAULT,
+                              preIntegrate=OFF,
+                              temperature=GRADIENT,
+                              thickness=0.1 * rel_depth,
+                              thicknessField='',
+                              thicknessModulus=None,
+                              thicknessType=UNIFORM,
+                              useDensity=OFF)
+
+
+def assign_sections(p, hard_set, soft_set):
+    p.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
+                        region=p.sets[hard_set], sectionName='hard', thicknessAssignment=FROM_SECTION)
+
+    p.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
+                        region=p.sets[soft_set], sectionName='soft', thicknessAssignment=FROM_SECTION)
+
+
+def analysis_step(m, name='Analysis', previous='Initial'):
+    # m.ExplicitDynamicsStep(improvedDtMethod=ON, maxIncrement=0.1, name='Analysis', previous='Initial')
+    m.ImplicitDynamicsStep(alpha=DEFAULT, amplitude=RAMP, application=QUASI_STATIC, initialConditions=OFF,
+                           initialInc=0.001, minInc=5e-5, maxInc=0.01, maxNumInc=10000, name=name, nlgeom=ON,
+                           nohaf=OFF, previous=previous)
+    # full history for the energy curve, field output only at the last increment for the deformed shape
+    m.historyOutputRequests['H-Output-1'].setValues(frequency=1)
+    m.fieldOutputRequests['F-Output-1'].setValues(frequency=LAST_INCREMENT)
+    # m.StaticStep(initialInc=0.001, maxInc=0.01, maxNumInc=10000, minInc=1e-20, name='Analysis', nlgeom=ON, previous='Initial', timePeriod=2.0)
+    # m.StaticRiksStep(initialArcInc=0.01, maxArcInc=0.1, maxLPF=1.0, maxNumInc=10000, name='Analysis', nlgeom=ON, previous='Initial')
+
+
+def reverse_step(m, u3):
+    # second loading stage continued from the converged state of the first step: the loaded vertex is driven
+    # back to u3 in a new step of the same job, and a restart point is written at the end of the first step
+    analysis_step(m, 'Reverse', 'Analysis')
+    m.boundaryConditions['Displacement'].setValuesInStep(stepName='Reverse', u3=u3)
+    m.steps['Analysis'].Restart(frequency=0, numberIntervals=1, overlay=ON, timeMarks=OFF)
+
+
+def energy_print(m, step):
+    # *Energy Print in one step, the .dat file then gives the energy curve to the monitor of the driver
+    m.keywordBlock.synchVersions(storeNodesAndElements=False)
+    blocks = m.keywordBlock.sieBlocks
+    start = [k for k, block in enumerate(blocks) if '*Step, name=' + step + ',' in block][0]
+    end = [k for k in range(start, len(blocks)) if blocks[k].startswith('*End Step')][0]
+    m.keywordBlock.insert(end - 1, '*Energy Print, frequency=1')
+
+
+def boundary_conditions(m, instance, csys, u3, force_set, block_set, sym_set):
+    # the boundary conditions of a previous stage are replaced
+    for name in ('Displacement', 'Lock', 'Sym'):
+        if name in m.boundaryConditions.keys():
+            del m.boundaryConditions[name]
+
+    m.DisplacementBC(amplitude=UNSET,
+                     createStepName='Analysis',
+                     distributionType=UNIFORM,
+                     fieldName='',
+                     localCsys=None,
+                     name='Displacement',
+                     region=instance.sets[force_set],
+                     u1=UNSET, u2=UNSET, u3=u3, ur1=UNSET, ur2=UNSET, ur3=UNSET)
+
+    m.DisplacementBC(amplitude=UNSET,
+                     createStepName='Analysis',
+                     distributionType=UNIFORM,
+                     fieldName='',
+                     localCsys=None,
+                     name='Lock',
+                     region=instance.sets[block_set],
+                     u1=UNSET, u2=UNSET, u3=SET, ur1=UNSET, ur2=UNSET, ur3=SET)
+
+    m.DisplacementBC(amplitude=UNSET,
+                     createStepName='Analysis',
+                     distributionType=UNIFORM,
+                     fieldName='',
+                     localCsys=csys,
+                     name='Sym',
+                     region=instance.sets[sym_set],
+                     u1=UNSET, u2=SET, u3=UNSET, ur1=SET, ur2=UNSET, ur3=SET)
+
 
-def model(x):
+def run_job(j, cae_file, debug):
+    # the CAE database is only written to disk when the model has to be inspected
+    j.submit()
+    j.waitForCompletion()
+    if debug:
+        mdb.saveAs(cae_file)
+
+
+def model(x, project='waterbomb', debug=False, mesh_scale=1.0, cpus=6, gpus=1, memory=90, export=False):
     [rel_depth, t1, t2, t3] = x
-    project = 'waterbomb'
 
     model_name = project + '_model'
     cae_file = project + '.cae'
@@ -28,18 +162,18 @@ def model(x):
     # Fixed variable that could be implemented in the optimization, but would result in a divergence
     # --------------------------------------------------------------------
 
-    n = 4
-    r_ext = 10.0
-    r_int = 1.0
-    size = 0.25
-    size2 = 0.1
+    n = parameters.n
+    r_ext = parameters.r_ext
+    r_int = parameters.r_int
+    size = parameters.size * mesh_scale  # mesh_scale > 1 gives the coarse screening mesh
+    size2 = parameters.size2 * mesh_scale
 
-    quadratic = False
-    hyperelastic = False
+    quadratic = parameters.quadratic
+    hyperelastic = parameters.hyperelastic
 
-    hard_mat = 2410.0
-    soft_mat = 15.2
-    c_coefficient = 0.015
+    hard_mat = parameters.hard_mat
+    soft_mat = parameters.soft_mat
+    c_coefficient = parameters.c_coefficient
 
     m = mdb.Model(modelType=STANDARD_EXPLICIT, name=model_name)
 
@@ -106,77 +240,18 @@ def model(x):
                                     point2=(0.0, 1.0, 0.0))
 
     # --------------------------------------------------------------------
-    # Material
-    # --------------------------------------------------------------------
-
-    m.Material(name='hard')
-    m.materials['hard'].Density(
-        table=((1.04e-09,),))
-    m.materials['hard'].Elastic(
-        table=((hard_mat, 0.35),))
-
-    m.Material(name='soft')
-    m.materials['soft'].Density(
-        table=((1.2e-09,),))
-    if not hyperelastic:
-        m.materials['soft'].Elastic(
-            table=((soft_mat, 0.45),))
-    else:
-        m.materials['soft'].Hyperelastic(materialType=ISOTROPIC, table=((c_coefficient, 0.0),), testData=OFF,
-                                         type=NEO_HOOKE, volumetricResponse=VOLUMETRIC_DATA)
-
-    # --------------------------------------------------------------------
-    # Section
+    # Material and section, shared by the two stages
     # --------------------------------------------------------------------
 
-    m.HomogeneousShellSection(idealization=NO_IDEALIZATION,
-                              integrationRule=SIMPSON,
-                              material='hard',
-                              name='hard',
-                              nodalThicknessField='',
-                              numIntPts=5,
-                              poissonDefinition=DEFAULT,
-                              preIntegrate=OFF,
-                              temperature=GRADIENT,
-                              thickness=0.1,
-                              thicknessField='',
-                              thicknessModulus=None,
-                              thicknessType=UNIFORM,
-                              useDensity=OFF)
-
-    m.HomogeneousShellSection(idealization=NO_IDEALIZATION,
-                              integrationRule=SIMPSON,
-                              material='soft',
-                              name='soft',
-                              nodalThicknessField='',
-                              numIntPts=5,
-                              poissonDefinition=DEFAULT,
-                              preIntegrate=OFF,
-                              temperature=GRADIENT,
-                              thickness=0.1 * rel_depth,
-                              thicknessField='',
-                              thicknessModulus=None,
-                              thicknessType=UNIFORM,
-                              useDensity=OFF)
-
-    p.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
-                        region=p.sets['hard'], sectionName='hard', thicknessAssignment=FROM_SECTION)
-
-    p.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
-                        region=p.sets['soft'], sectionName='soft', thicknessAssignment=FROM_SECTION)
+    materials(m, hard_mat, soft_mat, c_coefficient, hyperelastic)
+    sections(m, rel_depth)
+    assign_sections(p, 'hard', 'soft')
 
     # --------------------------------------------------------------------
-    # STEP
+    # STEP, shared by the two stages
     # --------------------------------------------------------------------
 
-    # m.ExplicitDynamicsStep(improvedDtMethod=ON, maxIncrement=0.1, name='Analysis', previous='Initial')
-    m.ImplicitDynamicsStep(alpha=DEFAULT, amplitude=RAMP, application=QUASI_STATIC, initialConditions=OFF,
-                           initialInc=0.001, minInc=5e-5, maxInc=0.01, maxNumInc=10000, name='Analysis', nlgeom=ON,
-                           nohaf=OFF, previous='Initial')
-    m.historyOutputRequests['H-Output-1'].setValues(frequency=1)
-    m.fieldOutputRequests['F-Output-1'].setValues(frequency=1)
-    # m.StaticStep(initialInc=0.001, maxInc=0.01, maxNumInc=10000, minInc=1e-20, name='Analysis', nlgeom=ON, previous='Initial', timePeriod=2.0)
-    # m.StaticRiksStep(initialArcInc=0.01, maxArcInc=0.1, maxLPF=1.0, maxNumInc=10000, name='Analysis', nlgeom=ON, previous='Initial')
+    analysis_step(m)
 
     # --------------------------------------------------------------------
     # Mesh
@@ -200,196 +275,64 @@ def model(x):
     # Boundary conditions and loading
     # --------------------------------------------------------------------
 
-    m.DisplacementBC(amplitude=UNSET,
-                     createStepName='Analysis',
-                     distributionType=UNIFORM,
-                     fieldName='',
-                     localCsys=None,
-                     name='Displacement',
-                     region=a.instances['base'].sets['force'],
-                     u1=UNSET, u2=UNSET, u3=-0.8 * r_ext, ur1=UNSET, ur2=UNSET, ur3=UNSET)
-
-    m.DisplacementBC(amplitude=UNSET,
-                     createStepName='Analysis',
-                     distributionType=UNIFORM,
-                     fieldName='',
-                     localCsys=None,
-                     name='Lock',
-                     region=a.instances['base'].sets['block'],
-                     u1=UNSET, u2=UNSET, u3=SET, ur1=UNSET, ur2=UNSET, ur3=SET)
-
-    m.DisplacementBC(amplitude=UNSET,
-                     createStepName='Analysis',
-                     distributionType=UNIFORM,
-                     fieldName='',
-                     localCsys=a.datums[csys.id],
-                     name='Sym',
-                     region=a.instances['base'].sets['sym'],
-                     u1=UNSET, u2=SET, u3=UNSET, ur1=SET, ur2=UNSET, ur3=SET)
+    boundary_conditions(m, a.instances['base'], a.datums[csys.id], -0.8 * r_ext, 'force', 'block', 'sym')
+    if parameters.continuation:
+        reverse_step(m, 0.8 * r_ext)  # same travel of 1.6 * r_ext as the second stage
 
     a.regenerate()
 
     # --------------------------------------------------------------------
-    # job
+    # job, submitted again for the second stage (a single job running both steps with the continuation)
     # --------------------------------------------------------------------
 
+    if parameters.continuation:
+        energy_print(m, 'Reverse')  # the monitor watches the reversed loading only, as in the headless decks
+    stamp('model')
+
     j = mdb.Job(atTime=None, contactPrint=OFF, description='', echoPrint=OFF,
                 explicitPrecision=SINGLE, getMemoryFromAnalysis=True, historyPrint=OFF,
-                memory=90, memoryUnits=PERCENTAGE, model=model_name, modelPrint=OFF,
+                memory=memory, memoryUnits=PERCENTAGE, model=model_name, modelPrint=OFF,
                 multiprocessingMode=DEFAULT, name=project, nodalOutputPrecision=SINGLE,
-                numCpus=6, numDomains=6, numGPUs=1, numThreadsPerMpiProcess=1, queue=None,
+                numCpus=cpus, numDomains=cpus, numGPUs=gpus, numThreadsPerMpiProcess=1, queue=None,
                 resultsFormat=ODB, scratch='', type=ANALYSIS, userSubroutine='',
                 waitHours=0, waitMinutes=0)
 
-    mdb.saveAs(cae_file)
-    j.submit()
-    j.waitForCompletion()
-    mdb.saveAs(cae_file)
+    if export:  # input deck of the first stage only, the reference of deck_check.py
+        j.writeInput(consistencyChecking=OFF)
+        return
 
-    odb = session.openOdb(name=odb_name)
-    data = session.XYDataFromHistory(name='data', odb=odb, steps=('Analysis',),
-                                     outputVariableName='Strain energy: ALLSE for Whole Model')
-    del mdb.models[model_name]
+    run_job(j, cae_file, debug)
+    stamp('job 1')
+    if parameters.continuation or os.path.exists(stop_name):  # terminated by the monitor of the driver
+        return
 
     # --------------------------------------------------------------------
-    # Deformed shape
+    # Deformed shape, replacing the base part in the same model
     # --------------------------------------------------------------------
 
-    m2 = mdb.Model(modelType=STANDARD_EXPLICIT, name=model_name)
-    p3 = m2.PartFromOdb(frame=len(data) - 1, instance='BASE', name='Deformed', odb=session.openOdb(odb_name),
-                        shape=DEFORMED, step=0)
-
-    # --------------------------------------------------------------------
-    # assembly
-    # --------------------------------------------------------------------
+    odb = session.openOdb(name=odb_name)
+    p3 = m.PartFromOdb(frame=len(odb.steps['Analysis'].frames) - 1, instance='BASE', name='Deformed', odb=odb,
+                       shape=DEFORMED, step=0)
+    odb.close()  # the second stage writes to the same odb
 
-    a = m2.rootAssembly
+    del a.instances['base']
+    del m.parts['base']
     a.Instance(dependent=ON, name='Deformed', part=p3)
-    csys = a.DatumCsysByThreePoints(coordSysType=CYLINDRICAL,
-                                    name='Cylindrical',
-                                    origin=(0.0, 0.0, 0.0),
-                                    point1=(1.0, 0.0, 0.0),
-                                    point2=(0.0, 1.0, 0.0))
-    # --------------------------------------------------------------------
-    # Material
-    # --------------------------------------------------------------------
-
-    m2.Material(name='hard')
-    m2.materials['hard'].Density(
-        table=((1.04e-09,),))
-    m2.materials['hard'].Elastic(
-        table=((hard_mat, 0.35),))
-
-    m2.Material(name='soft')
-    m2.materials['soft'].Density(
-        table=((1.2e-09,),))
-    if not hyperelastic:
-        m2.materials['soft'].Elastic(
-            table=((soft_mat, 0.45),))
-    else:
-        m2.materials['soft'].Hyperelastic(materialType=ISOTROPIC, table=((c_coefficient, 0.0),), testData=OFF,
-                                          type=NEO_HOOKE, volumetricResponse=VOLUMETRIC_DATA)
-
-    # --------------------------------------------------------------------
-    # Section
-    # --------------------------------------------------------------------
-
-    m2.HomogeneousShellSection(idealization=NO_IDEALIZATION,
-                               integrationRule=SIMPSON,
-                               material='hard',
-                               name='hard',
-                               nodalThicknessField='',
-                               numIntPts=5,
-                               poissonDefinition=DEFAULT,
-                               preIntegrate=OFF,
-                               temperature=GRADIENT,
-                               thickness=0.1,
-                               thicknessField='',
-                               thicknessModulus=None,
-                               thicknessType=UNIFORM,
-                               useDensity=OFF)
-
-    m2.HomogeneousShellSection(idealization=NO_IDEALIZATION,
-                               integrationRule=SIMPSON,
-                               material='soft',
-                               name='soft',
-                               nodalThicknessField='',
-                               numIntPts=5,
-                               poissonDefinition=DEFAULT,
-                               preIntegrate=OFF,
-                               temperature=GRADIENT,
-                               thickness=0.1 * rel_depth,
-                               thicknessField='',
-                               thicknessModulus=None,
-                               thicknessType=UNIFORM,
-                               useDensity=OFF)
-
-    p3.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
-                         region=p3.sets['HARD'], sectionName='hard', thicknessAssignment=FROM_SECTION)
-
-    p3.SectionAssignment(offset=0.0, offsetField='', offsetType=MIDDLE_SURFACE,
-                         region=p3.sets['SOFT'], sectionName='soft', thicknessAssignment=FROM_SECTION)
-
-    # --------------------------------------------------------------------
-    # STEP
-    # --------------------------------------------------------------------
-
-    # m.ExplicitDynamicsStep(improvedDtMethod=ON, maxIncrement=0.1, name='Analysis', previous='Initial')
-    m2.ImplicitDynamicsStep(alpha=DEFAULT, amplitude=RAMP, application=QUASI_STATIC, initialConditions=OFF,
-                            initialInc=0.001, minInc=5e-5, maxInc=0.01, maxNumInc=10000, name='Analysis', nlgeom=ON,
-                            nohaf=OFF, previous='Initial')
-    m2.historyOutputRequests['H-Output-1'].setValues(frequency=1)
-    m2.fieldOutputRequests['F-Output-1'].setValues(frequency=1)
-    # m.StaticStep(initialInc=0.001, maxInc=0.01, maxNumInc=10000, minInc=1e-20, name='Analysis', nlgeom=ON, previous='Initial', timePeriod=2.0)
-    # m.StaticRiksStep(initialArcInc=0.01, maxArcInc=0.1, maxLPF=1.0, maxNumInc=10000, name='Analysis', nlgeom=ON, previous='Initial')
+    assign_sections(p3, 'HARD', 'SOFT')
 
     # --------------------------------------------------------------------
     # Boundary conditions and loading
     # --------------------------------------------------------------------
 
-    m2.DisplacementBC(amplitude=UNSET,
-                      createStepName='Analysis',
-                      distributionType=UNIFORM,
-                      fieldName='',
-                      localCsys=None,
-                      name='Displacement',
-                      region=a.instances['Deformed'].sets['FORCE'],
-                      u1=UNSET, u2=UNSET, u3=1.6 * r_ext, ur1=UNSET, ur2=UNSET, ur3=UNSET)
-
-    m2.DisplacementBC(amplitude=UNSET,
-                      createStepName='Analysis',
-                      distributionType=UNIFORM,
-                      fieldName='',
-                      localCsys=None,
-                      name='Lock',
-                      region=a.instances['Deformed'].sets['BLOCK'],
-                      u1=UNSET, u2=UNSET, u3=SET, ur1=UNSET, ur2=UNSET, ur3=SET)
-
-    m2.DisplacementBC(amplitude=UNSET,
-                      createStepName='Analysis',
-                      distributionType=UNIFORM,
-                      fieldName='',
-                      localCsys=a.datums[csys.id],
-                      name='Sym',
-                      region=a.instances['Deformed'].sets['SYM'],
-                      u1=UNSET, u2=SET, u3=UNSET, ur1=SET, ur2=UNSET, ur3=SET)
+    boundary_conditions(m, a.instances['Deformed'], a.datums[csys.id], 1.6 * r_ext, 'FORCE', 'BLOCK', 'SYM')
 
     a.regenerate()
+    energy_print(m, 'Analysis')  # second stage only, the first one is not watched by the monitor
+    stamp('deformed')
 
     # --------------------------------------------------------------------
     # job
     # --------------------------------------------------------------------
-    del mdb.jobs['waterbomb']
 
-    j = mdb.Job(atTime=None, contactPrint=OFF, description='', echoPrint=OFF,
-                explicitPrecision=SINGLE, getMemoryFromAnalysis=True, historyPrint=OFF,
-                memory=90, memoryUnits=PERCENTAGE, model=model_name, modelPrint=OFF,
-                multiprocessingMode=DEFAULT, name=project, nodalOutputPrecision=SINGLE,
-                numCpus=6, numDomains=6, numGPUs=1, numThreadsPerMpiProcess=1, queue=None,
-                resultsFormat=ODB, scratch='', type=ANALYSIS, userSubroutine='',
-                waitHours=0, waitMinutes=0)
-
-    mdb.saveAs(cae_file)
-    j.submit()
-    j.waitForCompletion()
-    mdb.saveAs(cae_file)
+    run_job(j, cae_file, debug)
+    stamp('job 2')
@@ -1,54 +1,406 @@
-import subprocess
-import re
 import os
+import shutil
+import subprocess
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import deck_check
+import parameters
+import results
+from analysis import barrier, snap_through
+from checkpoint import claim
+from inp_deck import inverted, read_coordinates, restart_deck, write_deck
+from launcher import Launcher
+from monitor import Monitor
+from result_file import read_result, stop_name, write_result
+from telemetry import Telemetry, stamp
+from results import read_energy, save_curve
+
+# Settings of the blackbox, modified by the optimisation script before launching Nomad
+options = {"workers": 4,  # number of evaluations running side by side in a block
+           "work_root": "runs",  # folder holding one work directory per evaluation
+           "cache": None,  # cache.Cache storing the evaluations already computed, None to disable it
+           "debug": False,  # save the CAE models and keep the work directories
+           "curves": None,  # folder keeping the energy curve of every evaluation, None to discard them
+           "surrogate": None,  # surrogate.Surrogate pruning the points predicted to fail or to be poor
+           "monitor": False,  # terminate the runs that diverge while they are running
+           "horizon": None,  # with the monitor, step time after which a run without snap-through is terminated
+           "coarse": None,  # element size factor of a first coarse run, None to always use the production mesh
+           "margin": 0.05,  # the production mesh is run when the coarse objective is this close to the incumbent
+           "telemetry": None,  # JSON lines file receiving the timing of every evaluation, None to disable it
+           "timeout": None,  # seconds after which an Abaqus command is killed, None to wait for it
+           "scheduler": None,  # scheduler.Scheduler giving each job a host and a number of cores
+           "workstation": (6, 1, 90),  # cores, GPUs and memory percentage shared by the workers without scheduler
+           "replay": None,  # checkpoint.Replay logging the outputs given to Nomad, served again on a resume
+           "archive": None,  # archive.Archive keeping the curve and timings of every evaluation, None to disable it
+           "constants": {}}  # fixed values of parameters.py replaced for the campaign, set with set_constants
+
+launcher = Launcher()  # one event loop running the Abaqus commands of all the workers
+
+report_lock = threading.Lock()
+
+incumbent = float('inf')  # best production objective of this driver, for the coarse-first mode without cache
+incumbent_lock = threading.Lock()
 
 
-def run(cmd):
-    completed = subprocess.run(["powershell", "-Command", cmd], capture_output=True)
+def set_constants(values):
+    # replace fixed values of the model (n, r_ext, hard_mat...) in the driver and in the Abaqus scripts;
+    # the caches have to be created afterwards, their model hash depends on these values
+    for name, value in values.items():
+        if not hasattr(parameters, name):
+            raise ValueError("unknown model constant: " + name)
+        setattr(parameters, name, value)
+    options["constants"] = dict(options["constants"], **values)
+
+
+def run(cmd, cwd=None, slot=None):
+    # start an Abaqus command line without a shell, on the host of the scheduler slot (locally without one),
+    # its output goes to a log file of cwd named after the job (launcher.log_file)
+    backend = launcher if slot is None else slot.host.backend
+    completed = backend.run(cmd.split(), cwd=cwd, timeout=options["timeout"])
     return completed
 
 
-def bb_pynomad(var):
+def resources(slot):
+    # cores, GPUs and memory percentage of a job, an equal share of the workstation without scheduler
+    # (no GPU when there are fewer GPUs than workers)
+    if slot is None:
+        cpus, gpus, memory = options["workstation"]
+        workers = max(options["workers"], 1)
+        return max(cpus // workers, 1), gpus // workers, max(memory // workers, 1)
+    return slot.cpus, slot.gpus, slot.memory
+
+
+def launch_script(x, project, folder, mesh_scale=1.0, slot=None):
+    # write the launching script of one evaluation in its own work directory
+    cpus, gpus, memory = resources(slot)
+    with open(os.path.join(folder, "Launch.py"), "w") as f:
+        f.write("import os\n")
+        f.write("import sys\n")
+        f.write("import traceback\n")
+        f.write("sys.path.insert(0, " + repr(os.path.dirname(os.path.abspath(__file__))) + ")\n")
+        f.write("from result_file import write_result\n")
+        f.write("from telemetry import stamp\n")
+        f.write("stamp('kernel')\n")  # startup of the CAE kernel, measured by the driver from the launch
+        if options["constants"]:
+            f.write("import parameters\n")
+            f.write("parameters.__dict__.update(" + repr(options["constants"]) + ")\n")
+        f.write("try:\n")
+        f.write("    from fem_model import *\n")
+        f.write("    from post_process import *\n")
+        f.write("    model(" + str(x) + ", " + repr(project) + ", " + str(options["debug"]) + ", " + str(mesh_scale)
+                + ", " + str(cpus) + ", " + str(gpus) + ", " + str(memory) + ")\n")  # compute the model
+        f.write("    if not os.path.exists(" + repr(stop_name) + "):\n")
+        f.write("        post_process(" + str(x) + ", " + repr(project) + ")\n")  # extract the data
+        f.write("except Exception:\n")  # report the error to the driver instead of leaving it in stdout
+        f.write("    write_result({'x': " + str(x) + ", 'delta': None, 'status': 'error', "
+                "'diagnostics': {'message': traceback.format_exc()}})\n")
+        f.close()
+
+
+def headless(x, project, folder, mesh_scale=1.0, slot=None):
+    # the two loading stages are written as input decks and submitted without starting Abaqus/CAE,
+    # the second stage is meshed on the coordinates printed at the end of the first one, or continues from
+    # its restart point with parameters.continuation
+    deck_check.require()  # decks checked against the references first
+    cpus, gpus, memory = resources(slot)
+    options_line = " cpus=" + str(cpus) + (" gpus=" + str(gpus) if gpus else "") + " memory=" + str(memory) + "%" \
+                   + " interactive"
+    first = project + "_1"
+    size, size2 = parameters.size * mesh_scale, parameters.size2 * mesh_scale
+    continuation = parameters.continuation
+    turned = inverted(x, size, size2)
+    if turned:  # crossed crease lines, the mesh folds over itself
+        write_result({"x": x, "delta": None, "status": "infeasible",
+                      "diagnostics": {"message": str(turned) + " inverted elements"}}, folder)
+        return subprocess.CompletedProcess([], 0, b"", b"")
+    write_deck(os.path.join(folder, first + ".inp"), x, -0.8 * parameters.r_ext, size=size, restart=continuation,
+               size2=size2)
+    stamp("model", folder)
+    cmd_output = run("abaqus job=" + first + options_line, cwd=folder, slot=slot)
+    stamp("job 1", folder)
+    dat = os.path.join(folder, first + ".dat")
+    if os.path.exists(os.path.join(folder, stop_name)):  # terminated by the monitor
+        return cmd_output
+
+    if continuation:
+        if not os.path.exists(os.path.join(folder, first + ".res")) or not os.path.exists(dat):
+            write_result({"x": x, "delta": None, "status": "error",
+                          "diagnostics": {"message": "no restart point written by " + first}}, folder)
+            return cmd_output
+        initial = read_energy(dat)[0][-1]  # the reversed step starts from the stored energy of the first one
+        restart_deck(os.path.join(folder, project + ".inp"), x, 0.8 * parameters.r_ext)
+        stamp("restart", folder)
+        cmd_output = run("abaqus job=" + project + " oldjob=" + first + options_line, cwd=folder, slot=slot)
+    else:
+        nodes = read_coordinates(dat) if os.path.exists(dat) else []
+        if len(nodes) == 0:
+            write_result({"x": x, "delta": None, "status": "error",
+                          "diagnostics": {"message": "no deformed shape printed by " + first}}, folder)
+            return cmd_output
+        initial = 0.0
+        write_deck(os.path.join(folder, project + ".inp"), x, 1.6 * parameters.r_ext, nodes=nodes, size=size,
+                   size2=size2)
+        stamp("deformed", folder)
+        cmd_output = run("abaqus job=" + project + options_line, cwd=folder, slot=slot)
+    stamp("job 2", folder)
+    dat = os.path.join(folder, project + ".dat")
+    if not os.path.exists(dat):
+        write_result({"x": x, "delta": None, "status": "error",
+                      "diagnostics": {"message": "no energy printed by " + project}}, folder)
+        return cmd_output
+    energy, displacement = read_energy(dat, initial)
+    save_curve(energy, displacement, folder)
+
+    delta = barrier(energy, displacement)
+    status = "ok" if np.isfinite(delta) else "infeasible"
+    write_result({"x": x, "delta": float(delta), "status": status,
+                  "outputs": snap_through(energy, displacement, 1.6 * parameters.r_ext),
+                  "diagnostics": {"frames": len(energy)}}, folder)
+    stamp("post_process", folder)
+    return cmd_output
+
+
+def evaluate(x, mesh_scale=1.0):
+    return evaluate_status(x, mesh_scale)[0]
+
+
+def evaluate_status(x, mesh_scale=1.0, outputs=()):
+    # objective, status and extra outputs (peak reaction force, stroke at snap-through) of one point,
+    # `outputs` are the extra outputs the caller needs from a cache hit
+    record = Telemetry(x, mesh_scale)
+    energy, status, outputs = run_evaluation(x, mesh_scale, record, outputs)
+    if options["telemetry"] is not None:
+        record.write(options["telemetry"], status)
+    return energy, status, outputs
+
+
+def complete(hit, outputs=()):
+    # a cache hit holding the needed outputs; the successful runs cached before the outputs were recorded
+    # are computed again
+    return hit is not None and (hit["status"] != "ok" or all(name in hit["outputs"] for name in outputs))
+
+
+def run_evaluation(x, mesh_scale, record, outputs=()):
+    # skip the Abaqus run if the point was already computed
+    cache = options["cache"]
+    if cache is not None and mesh_scale != 1.0:
+        cache = cache.for_mesh(mesh_scale)
+    if cache is not None:
+        with record.phase("cache"):
+            hit = cache.get(x)
+        if complete(hit, outputs):
+            print("cache hit:" + str(x))
+            return hit["objective"], "cached", hit["outputs"]
+
+        # skip the points the surrogate of the history predicts to be infeasible or far from the incumbent
+        surrogate = options["surrogate"]
+        best = cache.best(1) if surrogate is not None and mesh_scale == 1.0 else []
+        if best:
+            with record.phase("surrogate"):
+                surrogate.update(cache)
+                keep = surrogate.screen(x, best[0]["objective"])
+            if not keep:
+                print("screened:" + str(x))
+                return float('inf'), "screened", {}
+
+    # every evaluation gets a unique job name and work directory, so several can run at the same time
+    start = time.time()
+    project = "waterbomb_" + uuid.uuid4().hex[:8]
+    folder = os.path.join(os.path.abspath(options["work_root"]), project)
+    os.makedirs(folder)
+    claim(folder, x, project)  # tells the next driver which evaluation was running here if this one dies
+    jobs = [project + "_1", project] if parameters.headless else [project]
+    slot = None
+    if options["scheduler"] is not None:
+        with record.phase("queue"):
+            slot = options["scheduler"].acquire()
+        record.data["host"], record.data["cpus"] = slot.host.name, slot.cpus
+    monitor = None
+    if options["monitor"]:
+        monitor = Monitor(folder, jobs, lambda job: run("abaqus terminate job=" + job, cwd=folder, slot=slot),
+                          horizon=options["horizon"])
+        monitor.start()
     try:
-        x = [var.get_coord(i) for i in range(var.size())]  # convert the Nomad input to list
-
-        # modify the launching script
-        with open("Launch.py", "w") as f:
-            f.write("from fem_model import *\n")
-            f.write("from post_process import *\n")
-            f.write("model(" + str(x) + ")\n")  # compute the model
-            f.write("post_process(" + str(x) + ")\n")  # extract the data
-            f.close()
-
-        # launch the script to the powershell
-        cmd_output = run("abaqus cae nogui=Launch.py")
-        result = re.search("stdout=b'(.*)', stderr", str(cmd_output))
-        print(cmd_output)
+        launched = time.time()
+        with record.phase("abaqus"):
+            if parameters.headless:
+                cmd_output = headless(x, project, folder, mesh_scale, slot)
+            else:
+                launch_script(x, project, folder, mesh_scale, slot)
+
+                # launch the CAE script
+                cmd_output = run("abaqus cae nogui=Launch.py", cwd=folder, slot=slot)
+
+        if monitor is not None:
+            monitor.stop()
+            if monitor.reason is not None:
+                write_result({"x": x, "delta": None, "status": "terminated",
+                              "diagnostics": {"message": "terminated by the monitor: " + monitor.reason}}, folder)
+
+        # read the FEM result located in the result record of the work directory
+        with record.phase("report"):
+            energy, status, outputs = report(cmd_output, folder)
+            if options["archive"] is not None:
+                archive_evaluation(x, energy, status, folder, project, mesh_scale, record, time.time() - start,
+                                   cache)
+            keep_curve(folder, project)
+        record.files(folder, project, jobs, launched)
+    finally:
+        if monitor is not None:
+            monitor.stop()
+        if slot is not None:
+            options["scheduler"].release(slot)
+
         # delete all the computation files
-        for file in os.listdir(os.getcwd()):
-            if file.startswith("waterbomb") or file.startswith("abaqus"):
-                os.remove(os.path.join(file))
+        with record.phase("cleanup"):
+            if not options["debug"]:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    if cache is not None:
+        cache.put(x, energy, status, time.time() - start, outputs)
+    return energy, status, outputs
+
+
+def multifidelity(x):
+    # coarse mesh first, the production mesh only for the points close to the incumbent,
+    # returns the objective and the mesh level it comes from (0 production, 1 coarse)
+    global incumbent
+    if options["coarse"] is None:
+        return evaluate(x), 0
+    energy = evaluate(x, options["coarse"])
+    best = options["cache"].best(1) if options["cache"] is not None else []
+    if energy > min([b["objective"] for b in best] + [incumbent]) + options["margin"]:
+        return energy, 1
+    energy = evaluate(x)
+    with incumbent_lock:
+        incumbent = min(incumbent, energy)
+    return energy, 0
+
 
-        # read the FEM result located in the Report.txt file
-        energy = report(result)
+def archive_evaluation(x, energy, status, folder, project, mesh_scale, record, elapsed, cache):
+    curve = os.path.join(folder, results.name)
+    curve = results.load_curve(curve) if os.path.exists(curve) else (None, None)
+    options["archive"].add(x, energy, status, curve[0], curve[1], elapsed, mesh_scale, project,
+                           dict(record.data["phases"]), cache.model if cache is not None else None)
+
+
+def keep_curve(folder, project):
+    # move the compact energy curve out of the work directory before it is deleted
+    curve = os.path.join(folder, results.name)
+    if options["curves"] is not None and os.path.exists(curve):
+        os.makedirs(options["curves"], exist_ok=True)
+        shutil.move(curve, os.path.join(options["curves"], project + ".npz"))
+
+
+def bb_pynomad(var):
+    x = [var.get_coord(i) for i in range(var.size())]  # convert the Nomad input to list
+
+    # the run being resumed gets the outputs given before the crash, so that Nomad follows the same path
+    replay = options["replay"]
+    found = replay.get(x) if replay is not None else None
+    if found is not None:
+        output, ok = found
+        if ok:
+            var.setBBO(output.encode("UTF-8"))
+        return int(ok)
+
+    try:
+        energy, level = multifidelity(x)
 
         # Print the result in the python console
         print("result:" + str(-energy))
 
-        # Send the result to Nomad
-        var.setBBO(str(energy).encode("UTF-8"))
-        return 1
+        # Send the result to Nomad, with the mesh level as an extra output in the coarse-first mode
+        output = str(energy) if options["coarse"] is None else str(energy) + " " + str(level)
+        var.setBBO(output.encode("UTF-8"))
+        ok = 1
     except Exception as e:
+        # reported to Nomad as a failed evaluation, the traceback is kept for the campaign
         print(f"An error occurred: {e}")
+        with report_lock:
+            with open("errors.log", "a") as file:
+                file.write(time.ctime() + "\n" + traceback.format_exc() + "\n")
+        output, ok = None, 0
+    if replay is not None:
+        replay.put(x, output, bool(ok))
+    return ok
 
 
-def report(result):
-    with open("Report.txt", "r") as file:
-        last_line = file.readlines()[-1]
-        file.close()
-        last_line = last_line[last_line.rfind("\t") + len("\t"):]
-    if result.group(1) == "" and last_line != '-inf\n':
-        value = -float(last_line)
+def bb_surrogate(var):
+    # static surrogate blackbox for Nomad, predicted from the evaluation history, optimised by surrogate_start
+    x = [var.get_coord(i) for i in range(var.size())]
+    objective, failure = options["surrogate"].predict(x)
+    if failure[0] < 0.5 and np.isfinite(objective[0]):
+        value = objective[0]
     else:
         value = float('inf')
-    return value
+    var.setBBO(str(value).encode("UTF-8"))
+    return 1
+
+
+def bb_pynomad_block(block):
+    # evaluate a block of Nomad points (BB_MAX_BLOCK_SIZE > 1) through a pool of workers
+    points = [block.get_x(k) for k in range(block.size())]
+    with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+        return [bool(ok) for ok in pool.map(bb_pynomad, points)]
+
+
+def surrogate_start(x0, lb, ub, budget=500):
+    # best point of a Nomad run on the surrogate predictions alone (milliseconds per point), to start the Abaqus
+    # run from; x0 while the surrogate has too few successful evaluations to predict the objective
+    import PyNomad
+    surrogate = options["surrogate"]
+    if surrogate is None or options["cache"] is None:
+        return x0
+    surrogate.update(options["cache"])
+    if surrogate.weights is None:
+        return x0
+    params = ["DIMENSION " + str(int(len(x0))), "BB_OUTPUT_TYPE OBJ", "MAX_BB_EVAL " + str(budget),
+              "BB_INPUT_TYPE (" + " ".join("R" for xi in x0) + ")", "DISPLAY_DEGREE 0"]
+    result = PyNomad.optimize(bb_surrogate, x0, lb, ub, params)
+    if len(result.get("x_best", [])) and np.isfinite(result["f_best"]):
+        return list(result["x_best"])
+    return x0
+
+
+def nomad_params(x0, workers, budget=1000, stats_file="Blackbox_result.txt"):
+    # Nomad settings of the waterbomb problem, with the mesh level as extra output in the coarse-first mode
+    return ["DIMENSION " + str(int(len(x0))),
+            "BB_OUTPUT_TYPE OBJ" if options["coarse"] is None else "BB_OUTPUT_TYPE OBJ EXTRA_O",
+            "MAX_BB_EVAL " + str(budget),
+            "BB_INPUT_TYPE (" + " ".join("R" for xi in x0) + ")",
+            "BB_MAX_BLOCK_SIZE " + str(workers),
+            "DISPLAY_ALL_EVAL true",
+            "DISPLAY_STATS BBE ( sol ) OBJ",
+            'stats_file "' + stats_file + '" BBE ( sol ) OBJ',
+            'DISPLAY_DEGREE 2']
+
+
+def report(cmd_output, folder="."):
+    record = read_result(folder)
+    if record is None:
+        record = {"delta": None, "status": "error",
+                  "diagnostics": {"message": "no result record, exit code " + str(cmd_output.returncode)}}
+
+    if record["status"] == "error":
+        print(cmd_output)
+        print(record["diagnostics"]["message"])
+    else:
+        # keep the campaign record of all the evaluations in the main Report.txt file
+        with report_lock:
+            with open("Report.txt", "a") as file:
+                file.write("\t".join(str(xi) for xi in record["x"]) + "\t" + str(record["delta"]) + "\n")
+
+    if record["status"] == "ok":
+        value, status = -record["delta"], "ok"
+    elif record["status"] in ("infeasible", "terminated"):
+        value, status = float('inf'), record["status"]
+    else:
+        value, status = float('inf'), "failed"
+    return value, status, record.get("outputs", {})
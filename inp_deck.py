@@ -0,0 +1,280 @@
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+import parameters
+
+# Input deck of the waterbomb sector written without Abaqus/CAE, so that the jobs can be launched with
+# "abaqus job=... input=..." directly. The sector between r_int and r_ext and between the angles 0 and pi/n
+# is cut by the two crease lines (r_ext, t1) -> (r_int, t2) -> (r_ext, t3) into three regions:
+#     left  : between the symmetry edge at angle 0 and the first crease line  -> soft
+#     wedge : between the two crease lines, closed on the inner arc at t2      -> hard
+#     right : between the second crease line and the symmetry edge at pi/n    -> soft
+# Each region is meshed with a transfinite (Coons) mapping on a structured grid. The wedge is a degenerate
+# quadrilateral whose inner side is the single point (r_int, t2), its first row of elements is made of S3.
+# The "block" node is the outer corner at angle 0 and the "force" node is the crease vertex (r_int, t2).
+# With parameters.template_mesh, the numbers of elements of the regions are those of a reference design and the
+# connectivity and node sets are built once per topology (n, radii, element size): the mesh of a design is the
+# same grids morphed onto its crease lines, and designs differing only by rel_depth share the same nodes.
+
+
+def polar(r, theta):
+    return np.stack((r * np.cos(theta), r * np.sin(theta)), axis=-1)
+
+
+def coons(bottom, top, left, right):
+    # transfinite interpolation of a grid (v, u) from its four boundary curves,
+    # bottom/top are sampled along u (shape (nu, 2)) and left/right along v (shape (nv, 2))
+    u = np.linspace(0.0, 1.0, len(bottom))[None, :, None]
+    v = np.linspace(0.0, 1.0, len(left))[:, None, None]
+    return ((1 - v) * bottom[None] + v * top[None] + (1 - u) * left[:, None] + u * right[:, None]
+            - (1 - u) * (1 - v) * bottom[0] - u * (1 - v) * bottom[-1] - (1 - u) * v * top[0] - u * v * top[-1])
+
+
+def grid_elements(shape, offset):
+    # connectivity of the quadrilaterals of a structured grid of nodes numbered row by row from offset,
+    # counterclockwise so that the shell normals point to +z
+    nv, nu = shape
+    index = offset + np.arange(nv * nu).reshape(nv, nu)
+    return np.stack((index[:-1, :-1], index[1:, :-1], index[1:, 1:], index[:-1, 1:]), axis=-1).reshape(-1, 4)
+
+
+def divisions(t1, t2, t3, n, r_int, r_ext, size, size2):
+    # numbers of elements across the radius (size on the crease and symmetry lines) and along the left, wedge
+    # and right regions (size2 on the inner and outer arcs, the finer of the two arcs as the structured CAE mesh)
+    angle = np.pi / n
+
+    def along(inner, outer):
+        return max(int(np.ceil(r_int * inner / size2)), int(np.ceil(r_ext * outer / size2)), 1)
+
+    return (max(int(np.ceil((r_ext - r_int) / size)), 1), along(t2 * angle, t1 * angle),
+            along(0.0, (t3 - t1) * angle), along(angle - t2 * angle, angle - t3 * angle))
+
+
+def regions(t1, t2, t3, counts, n, r_int, r_ext):
+    # structured grids (v, u, 2) of the three regions for the crease positions of a design
+    nv, k_left, k_wedge, k_right = counts
+    angle = np.pi / n
+    a1, a2, a3 = t1 * angle, t2 * angle, t3 * angle
+    p1, p2, p3 = polar(r_ext, a1), polar(r_int, a2), polar(r_ext, a3)
+    v = np.linspace(0.0, 1.0, nv + 1)[:, None]
+
+    def arc(r, a, b, k):
+        return polar(r, np.linspace(a, b, k + 1))
+
+    return {'left': coons(arc(r_int, 0.0, a2, k_left), arc(r_ext, 0.0, a1, k_left),
+                          polar(np.linspace(r_int, r_ext, nv + 1), 0.0), p2 + v * (p1 - p2)),
+            'wedge': coons(np.repeat(p2[None], k_wedge + 1, axis=0), arc(r_ext, a1, a3, k_wedge),
+                           p2 + v * (p1 - p2), p2 + v * (p3 - p2)),
+            'right': coons(arc(r_int, a2, angle, k_right), arc(r_ext, a3, angle, k_right),
+                           p2 + v * (p3 - p2), polar(np.linspace(r_int, r_ext, nv + 1), angle))}
+
+
+def points(grids):
+    return np.concatenate([grids[name].reshape(-1, 2) for name in ('left', 'wedge', 'right')])
+
+
+def mesh(x, n=None, r_int=None, r_ext=None, size=None, template=None, size2=None):
+    # nodes (N, 3), S4 connectivity, S3 connectivity, their region names and the node sets of the model
+    [rel_depth, t1, t2, t3] = x
+    n = parameters.n if n is None else n
+    r_int = parameters.r_int if r_int is None else r_int
+    r_ext = parameters.r_ext if r_ext is None else r_ext
+    size = parameters.size if size is None else size
+    size2 = parameters.size2 if size2 is None else size2
+    template = parameters.template_mesh if template is None else template
+
+    if template:
+        topology = mesh_template(n, r_int, r_ext, size, size2)
+        return (morph(t1, t2, t3, n, r_int, r_ext, size, size2),) + topology[1:-1]
+    counts = divisions(t1, t2, t3, n, r_int, r_ext, size, size2)
+    return assemble(regions(t1, t2, t3, counts, n, r_int, r_ext), n, r_int, r_ext, t2)[:-1]
+
+
+def signed_areas(nodes, elements):
+    # twice the area of the elements seen from +z, positive for the counter-clockwise ones
+    xy = nodes[elements][..., :2]
+    following = np.roll(xy, -1, axis=1)
+    return np.sum(xy[..., 0] * following[..., 1] - following[..., 0] * xy[..., 1], axis=1)
+
+
+def inverted(x, size=None, size2=None):
+    # number of elements turned over, as with crossed crease lines (t1 > t3): no Abaqus run for such a design
+    nodes, s4, s3 = mesh(x, size=size, size2=size2)[:3]
+    return sum(int(np.count_nonzero(signed_areas(nodes, elements) <= 0)) for elements in (s4, s3) if len(elements))
+
+
+def assemble(grids, n, r_int, r_ext, t2):
+    # merge the nodes shared by the regions (crease lines and the collapsed side of the wedge),
+    # returns the mesh and the index of the nodes in the points of the grids
+    angle = np.pi / n
+    p2 = polar(r_int, t2 * angle)
+    elements, labels, offset = [], [], 0
+    for name in ('left', 'wedge', 'right'):
+        grid = grids[name]
+        elements.append(grid_elements(grid.shape[:2], offset))
+        labels += [name] * (elements[-1].shape[0])
+        offset += grid.shape[0] * grid.shape[1]
+    merged = points(grids)
+    scale = 1e-6 * r_ext
+    _, first, inverse = np.unique(np.round(merged / scale).astype(np.int64), axis=0, return_index=True,
+                                  return_inverse=True)
+    order = np.argsort(first)  # keep the nodes in order of appearance
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    nodes = np.column_stack((merged[first[order]], np.zeros(len(order))))
+    elements = rank[inverse.ravel()][np.concatenate(elements)]
+    labels = np.array(labels)
+
+    # quadrilaterals with a repeated node become triangles
+    repeated = (elements == np.roll(elements, 1, axis=1))
+    triangle = repeated.any(axis=1)
+    s3 = np.array([row[~rep] for row, rep in zip(elements[triangle], repeated[triangle])], dtype=int).reshape(-1, 3)
+
+    radius = np.hypot(nodes[:, 0], nodes[:, 1])
+    theta = np.arctan2(nodes[:, 1], nodes[:, 0])
+    tolerance = 1e-6 * r_ext
+    node_sets = {'block': np.flatnonzero((np.abs(radius - r_ext) < tolerance) & (np.abs(theta) < 1e-9)),
+                 'force': np.flatnonzero(np.hypot(nodes[:, 0] - p2[0], nodes[:, 1] - p2[1]) < tolerance),
+                 'sym': np.flatnonzero((np.abs(theta) < 1e-9) | (np.abs(theta - angle) < 1e-9))}
+
+    return nodes, elements[~triangle], s3, labels[~triangle], labels[triangle], node_sets, first[order]
+
+
+# crease positions (t1, t2, t3) of the reference design of the templates, the starting design of optim_file.py
+reference = (0.1, 0.5, 0.9)
+templates = {}
+template_lock = threading.Lock()
+
+
+def mesh_template(n, r_int, r_ext, size, size2):
+    # numbers of elements, connectivity, node sets and node index of a topology, built once on the reference
+    key = (n, r_int, r_ext, size, size2)
+    with template_lock:
+        if key not in templates:
+            counts = divisions(*reference, n, r_int, r_ext, size, size2)
+            topology = assemble(regions(*reference, counts, n, r_int, r_ext), n, r_int, r_ext, reference[1])
+            templates[key] = (counts,) + topology[1:]
+        return templates[key]
+
+
+@lru_cache(maxsize=64)
+def morph(t1, t2, t3, n, r_int, r_ext, size, size2):
+    # nodes of the template on the crease lines of a design: the grids of the reference evaluated for the new
+    # boundary curves, no merge nor search; cached for the designs differing only by rel_depth
+    template = mesh_template(n, r_int, r_ext, size, size2)
+    merged = points(regions(t1, t2, t3, template[0], n, r_int, r_ext))[template[-1]]
+    nodes = np.column_stack((merged, np.zeros(len(merged))))
+    nodes.flags.writeable = False
+    return nodes
+
+
+def write_lines(f, values, per_line=16):
+    values = [str(value) for value in values]
+    for i in range(0, len(values), per_line):
+        f.write(", ".join(values[i:i + per_line]) + "\n")
+
+
+def write_step(f, name, u3, supports=True, restart=False):
+    f.write("*Step, name=" + name + ", nlgeom=YES, inc=10000\n")
+    f.write("*Dynamic, application=QUASI-STATIC, initial=NO\n0.001, 1., 5e-05, 0.01\n")
+    f.write("*Boundary\nforce, 3, 3, %r\n" % u3)
+    if supports:  # kept from the previous step otherwise
+        f.write("block, 3, 3\nblock, 6, 6\nsym, 2, 2\nsym, 4, 4\nsym, 6, 6\n")
+    if restart:  # converged state of the end of the step, overwritten by the next one
+        f.write("*Restart, write, overlay, number interval=1, time marks=NO\n")
+    # field output of the last increment only, the curve is taken from the history and the .dat file
+    f.write("*Output, field, frequency=99999\n*Node Output\nU,\n*Element Output\nS,\n")
+    f.write("*Output, history, frequency=1\n*Energy Output\nALLSE,\n")
+    # printed to the .dat file so that the driver can read them without opening the odb
+    f.write("*Energy Print, frequency=1\n")
+    f.write("*Node Print, nset=all, frequency=100000\nCOORD,\n")
+    f.write("*End Step\n")
+
+
+def write_deck(path, x, u3, nodes=None, r_ext=None, hard_mat=None, soft_mat=None, size=None, restart=False,
+               size2=None):
+    # write the input deck of one loading stage, `nodes` replaces the coordinates of the mesh (deformed shape),
+    # `restart` keeps the end state of the stage for a restart_deck
+    [rel_depth, t1, t2, t3] = x
+    r_ext = parameters.r_ext if r_ext is None else r_ext
+    hard_mat = parameters.hard_mat if hard_mat is None else hard_mat
+    soft_mat = parameters.soft_mat if soft_mat is None else soft_mat
+    if parameters.quadratic:  # S8R/STRI65 need mid-side nodes, not generated here
+        raise ValueError("quadratic elements are not supported by the input decks, use the CAE model")
+
+    mesh_nodes, s4, s3, s4_region, s3_region, node_sets = mesh(x, r_ext=r_ext, size=size, size2=size2)
+    if nodes is None:
+        nodes = mesh_nodes
+
+    s4_id = np.arange(1, len(s4) + 1)
+    s3_id = np.arange(len(s4) + 1, len(s4) + len(s3) + 1)
+    hard = np.concatenate((s4_id[s4_region == 'wedge'], s3_id[s3_region == 'wedge']))
+    soft = np.concatenate((s4_id[s4_region != 'wedge'], s3_id[s3_region != 'wedge']))
+
+    with open(path, "w") as f:
+        f.write("*Heading\nwaterbomb x=" + str(list(x)) + "\n")
+        f.write("*Node\n")
+        for i, node in enumerate(nodes):
+            f.write("%d, %.9g, %.9g, %.9g\n" % (i + 1, node[0], node[1], node[2]))
+        f.write("*Element, type=S4\n")
+        for i, element in zip(s4_id, s4 + 1):
+            f.write("%d, %d, %d, %d, %d\n" % (i, element[0], element[1], element[2], element[3]))
+        if len(s3):
+            f.write("*Element, type=S3\n")
+            for i, element in zip(s3_id, s3 + 1):
+                f.write("%d, %d, %d, %d\n" % (i, element[0], element[1], element[2]))
+        f.write("*Nset, nset=all, generate\n1, %d, 1\n" % len(nodes))
+        for name in ('hard', 'soft'):
+            f.write("*Elset, elset=" + name + "\n")
+            write_lines(f, hard if name == 'hard' else soft)
+        for name in ('block', 'force', 'sym'):
+            f.write("*Nset, nset=" + name + "\n")
+            write_lines(f, node_sets[name] + 1)
+
+        # cylindrical system for the symmetry, as the "Cylindrical" datum of the CAE model
+        f.write("*Transform, nset=sym, type=C\n0., 0., 0., 0., 0., 1.\n")
+
+        f.write("*Material, name=hard\n*Density\n1.04e-09,\n*Elastic\n%r, 0.35\n" % hard_mat)
+        if parameters.hyperelastic:  # same neo-Hookean law as fem_model.materials
+            f.write("*Material, name=soft\n*Density\n1.2e-09,\n*Hyperelastic, neo hooke\n%r, 0.\n"
+                    % parameters.c_coefficient)
+        else:
+            f.write("*Material, name=soft\n*Density\n1.2e-09,\n*Elastic\n%r, 0.45\n" % soft_mat)
+        f.write("*Shell Section, elset=hard, material=hard\n0.1, 5\n")
+        f.write("*Shell Section, elset=soft, material=soft\n%r, 5\n" % (0.1 * rel_depth))
+
+        write_step(f, "Analysis", u3, restart=restart)
+
+
+def restart_deck(path, x, u3):
+    # second loading stage continued from the restart point of the first one ("abaqus job=... oldjob=..."):
+    # the model and the stress state come from the restart file, only the reversed loading step is written
+    with open(path, "w") as f:
+        f.write("*Heading\nwaterbomb x=" + str(list(x)) + " (continued)\n")
+        f.write("*Restart, read, step=1\n")
+        write_step(f, "Reverse", u3, supports=False)
+
+
+def read_coordinates(dat_path):
+    # last table of nodal coordinates printed in the .dat file (written at the end of the step)
+    number = r"[-+]?\d*\.?\d+(?:[EeDd][-+]?\d+)?"
+    row = re.compile(r"^\s*(\d+)\s+(" + number + r")\s+(" + number + r")\s+(" + number + r")\s*$")
+    table, last = None, {}
+    with open(dat_path, "r") as f:
+        for line in f:
+            if "N O D E   O U T P U T" in line:
+                table = last = {}
+            elif table is not None:
+                match = row.match(line)
+                if match:
+                    table[int(match.group(1))] = [float(value) for value in match.group(2, 3, 4)]
+                elif line.strip().startswith("MAXIMUM"):
+                    table = None
+    coordinates = np.zeros((max(last) if last else 0, 3))
+    for label, value in last.items():
+        coordinates[label - 1] = value
+    return coordinates
+
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import threading
+
+# Start the Abaqus commands without a shell, on Linux and Windows, from one asyncio event loop running in a
+# background thread: the worker threads of the driver submit their commands to the same loop and wait for them.
+# The output of every command is written to a log file of its work directory instead of being kept in memory,
+# one per job and command (see log_name), and a command running longer than its timeout is killed together with
+# its child processes (solver).
+
+log_name = "run.log"  # commands without a job or script
+
+
+def log_file(args):
+    # log of a command, named after its job (<job>.run.log, <job>.terminate.run.log...) or its CAE script
+    # (<script>.run.log); not <job>.log, written by Abaqus itself
+    names = [arg.split("=", 1)[1] for arg in args[1:] if arg.lower().startswith(("job=", "nogui=", "script="))]
+    if not names:
+        return log_name
+    name = os.path.splitext(os.path.basename(names[0]))[0]
+    commands = [arg for arg in args[1:] if "=" not in arg and arg not in ("interactive", "cae")]
+    return ".".join([name] + commands + ["run.log"])
+
+
+class Launcher:
+
+    def __init__(self, tail=4096):
+        self.tail = tail  # bytes of the end of the log returned as the stdout of the completed process
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # the event loop is only started by the first command
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.loop
+
+    def run(self, args, cwd=None, timeout=None, log=None):
+        # blocking call from any thread, returns a subprocess.CompletedProcess; `log` replaces the name of the log
+        future = asyncio.run_coroutine_threadsafe(self.execute(args, cwd, timeout, log), self.start())
+        return future.result()
+
+    async def execute(self, args, cwd, timeout, log=None):
+        program = shutil.which(args[0]) or args[0]  # abaqus.bat on Windows, abaqus on Linux
+        log = os.path.join(cwd or ".", log or log_file(args))
+        with open(log, "ab") as f:
+            f.write((" ".join(args) + "\n").encode("UTF-8"))
+            f.flush()
+            process = await asyncio.create_subprocess_exec(program, *args[1:], cwd=cwd, stdout=f,
+                                                           stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                                           start_new_session=(os.name != "nt"))
+            timed_out = False
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                await self.kill(process)
+
+        with open(log, "rb") as f:
+            f.seek(max(os.path.getsize(log) - self.tail, 0))
+            output = f.read()
+        return subprocess.CompletedProcess(args, process.returncode, output, b"timeout" if timed_out else b"")
+
+    async def kill(self, process, grace=10.0):
+        # the whole process tree: the abaqus launcher starts the solver as a child process
+        if os.name == "nt":
+            killer = await asyncio.create_subprocess_exec("taskkill", "/F", "/T", "/PID", str(process.pid),
+                                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            await killer.wait()
+        else:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(process.wait(), grace)
+            except asyncio.TimeoutError:
+                os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
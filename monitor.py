@@ -0,0 +1,123 @@
+import os
+import threading
+
+import numpy as np
+
+from analysis import derivative
+from result_file import stop_name
+from results import energy_line, time_line
+
+# Watch the files of a running evaluation and terminate the Abaqus job as soon as it is clearly lost:
+#     - "collapse": `collapse` converged increments in a row at less than twice the minimum increment,
+#     - "monotonic", only with a `horizon`: the step time of the last job reached `horizon` without any negative
+#       energy slope (*Energy Print lines of the .dat file of the last job, the reversed loading of both the
+#       headless decks and the CAE model).
+# The "monotonic" rule is a heuristic: a snap-through starting after `horizon` would be lost with it, and the
+# objective seen by Nomad would change, so it is off unless a horizon is given.
+# The CAE model submits its two stages under the same job name: the files of the second job replace those of
+# the first one and are read again from their start.
+
+
+def parse_sta_line(line):
+    # (increment, cut back, step time, time increment) of a line of the .sta file, None for other lines
+    words = line.split()
+    if len(words) < 9 or not (words[0].isdigit() and words[1].isdigit()):
+        return None
+    try:
+        return int(words[1]), words[2].endswith("U"), float(words[7]), float(words[8])
+    except ValueError:
+        return None
+
+
+class Follow:
+    # read the complete lines appended to a file since the last call, restart when the file is rewritten
+    def __init__(self, path, head_size=256):
+        self.path = path
+        self.head_size = head_size
+        self.offset = 0
+        self.rest = ""
+        self.identity = None
+        self.head = ""
+
+    def lines(self):
+        if not os.path.exists(self.path):
+            return [], False
+        with open(self.path, "r", errors="replace") as f:
+            status = os.fstat(f.fileno())
+            head = f.read(self.head_size)
+            # written by another job: new file, shorter file or other first lines (date and time of the run)
+            restarted = self.identity is not None and (status.st_ino != self.identity or status.st_size < self.offset
+                                                       or head[:len(self.head)] != self.head)
+            if restarted:
+                self.offset, self.rest = 0, ""
+            self.identity, self.head = status.st_ino, head
+            f.seek(self.offset)
+            text = self.rest + f.read()
+            self.offset = f.tell()
+        lines = text.split("\n")
+        self.rest = lines.pop()
+        return lines, restarted
+
+
+class Monitor(threading.Thread):
+
+    def __init__(self, folder, jobs, terminate, min_inc=5e-5, collapse=20, horizon=None, interval=5.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.folder = folder
+        self.jobs = jobs
+        self.terminate = terminate  # function terminating a job from its name
+        self.min_inc = min_inc
+        self.collapse = collapse
+        self.horizon = horizon
+        self.interval = interval
+        self.reason = None
+        self.done = threading.Event()
+        self.sta = [Follow(os.path.join(folder, job + ".sta")) for job in jobs]
+        self.dat = Follow(os.path.join(folder, jobs[-1] + ".dat"))
+        self.small = [0] * len(jobs)
+        self.current, self.times, self.energies = 0.0, [0.0], [0.0]
+
+    def check(self):
+        for k, follow in enumerate(self.sta):
+            lines, restarted = follow.lines()
+            if restarted:
+                self.small[k] = 0
+            for line in lines:
+                increment = parse_sta_line(line)
+                if increment is None or increment[1]:
+                    continue
+                self.small[k] = self.small[k] + 1 if increment[3] <= 2 * self.min_inc else 0
+                if self.small[k] >= self.collapse:
+                    return self.jobs[k], "collapse"
+
+        lines, restarted = self.dat.lines()
+        if restarted:
+            self.current, self.times, self.energies = 0.0, [0.0], [0.0]
+        for line in lines:
+            # same parsing as results.stream_energy, keeping the step time between two reads
+            match = time_line.search(line)
+            if match:
+                self.current = float(match.group(1))
+                continue
+            match = energy_line.search(line)
+            if match:
+                self.times.append(self.current)
+                self.energies.append(float(match.group(1)))
+        if self.horizon is not None and self.times[-1] >= self.horizon and len(self.times) > 3:
+            if not np.any(derivative(self.energies, self.times) < 0):
+                return self.jobs[-1], "monotonic"
+        return None
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            found = self.check()
+            if found is not None:
+                job, self.reason = found
+                # the marker stops the remaining stages of the evaluation
+                open(os.path.join(self.folder, stop_name), "w").close()
+                self.terminate(job)
+                return
+
+    def stop(self):
+        self.done.set()
+        self.join()
@@ -1,20 +1,43 @@
 import PyNomad
 from functions import *
+from cache import Cache
+from surrogate import Surrogate
+from scheduler import Host, Scheduler
+from archive import Archive
+from checkpoint import Checkpoint, cleanup
+from parameters import lb, ub
 
 name = "waterbomb"
 
 x0 = [1.0, 0.1, 0.5, 0.9]
 
-lb = [0.0, 0.01, 0.01, 0.01]
-ub = [2.0, 0.99, 0.99, 0.99]
+# hosts of the campaign and Abaqus analysis tokens of the license server, the scheduler picks the cores per job;
+# remote hosts take backend=SSHBackend("name") and need the work directories on a shared file system
+options["scheduler"] = Scheduler([Host("localhost", cores=6, memory=32.0, gpus=1)], tokens=12)
+workers = options["scheduler"].workers  # maximum number of Abaqus evaluations running at the same time
+options["workers"] = workers
+options["cache"] = Cache("cache.sqlite")
+options["monitor"] = True  # stops the collapsing runs; options["horizon"] = 0.75 also the runs without snap-through
+options["telemetry"] = "telemetry.jsonl"  # timing of every evaluation, summary with: python telemetry.py
+options["archive"] = Archive("archive")  # curve of every evaluation, summary with: python archive.py
+options["coarse"] = None  # e.g. 3.0 to screen every point on a mesh 3 times coarser first
+options["surrogate"] = Surrogate(lb, ub)  # prune the points predicted to fail, bb_surrogate gives its predictions
 
-params = ["DIMENSION "+str(int(len(x0))),
-          "BB_OUTPUT_TYPE OBJ", 
-          "MAX_BB_EVAL 1000", 
-          "BB_INPUT_TYPE (R R R R)",
-          "DISPLAY_ALL_EVAL true",
-          "DISPLAY_STATS BBE ( sol ) OBJ", 
-          'stats_file "Blackbox_result.txt" BBE ( sol ) OBJ',
-          'DISPLAY_DEGREE 2']
+# work directories left by a driver that died, their Abaqus jobs are terminated
+cleanup(options["work_root"], run)
 
-PyNomad.optimize(bb_pynomad, x0, lb, ub, params)
+# a run stopped by a crash is started again with its own settings, Nomad replays it with the outputs it was given
+checkpoint = Checkpoint("checkpoint.json")
+options["replay"] = checkpoint.replay
+if checkpoint.pending() is None:
+    # warm-start from the best design already computed with this model, improved on the surrogate of the cache
+    best = options["cache"].best(1)
+    if best:
+        x0 = best[0]["x"]
+    x0 = surrogate_start(x0, lb, ub)
+
+params = nomad_params(x0, workers, budget=1000)
+x0, params = checkpoint.start(x0, params, options["cache"])
+result = PyNomad.optimize(bb_pynomad_block, x0, lb, ub, params)
+checkpoint.finish(result)
+options["archive"].close()
@@ -0,0 +1,48 @@
+# --------------------------------------------------------------------
+# Bounds of the optimization variables, shared by optim_file.py, doe.py and campaign.py
+# --------------------------------------------------------------------
+
+lb = [0.0, 0.01, 0.01, 0.01]
+ub = [2.0, 0.99, 0.99, 0.99]
+
+# --------------------------------------------------------------------
+# Fixed variable that could be implemented in the optimization, but would result in a divergence
+# --------------------------------------------------------------------
+
+n = 4
+r_ext = 10.0
+r_int = 1.0
+size = 0.25
+size2 = 0.1
+
+quadratic = False
+hyperelastic = False
+
+hard_mat = 2410.0
+soft_mat = 15.2
+c_coefficient = 0.015
+
+# second loading stage continued from the stressed end state of the first one (reversed displacement step)
+# instead of reloading the stress-free deformed shape
+continuation = False
+
+# model written as input decks by inp_deck and submitted without Abaqus/CAE, instead of built in Abaqus/CAE;
+# the two give different meshes, so the results are cached apart
+headless = False
+
+# headless decks meshed by morphing one template mesh per topology (see inp_deck.py) instead of meshing every design
+template_mesh = False
+
+
+def constants():
+    # every fixed value of the model, used to tell apart the results of different models
+    values = {"n": n, "r_ext": r_ext, "r_int": r_int, "size": size, "size2": size2,
+              "quadratic": quadratic, "hyperelastic": hyperelastic,
+              "hard_mat": hard_mat, "soft_mat": soft_mat, "c_coefficient": c_coefficient}
+    if headless:  # only when enabled, as the options below
+        values["mesher"] = "deck"
+    if continuation:  # only when enabled, so that the caches of the original procedure stay valid
+        values["continuation"] = continuation
+    if template_mesh:
+        values["template_mesh"] = template_mesh
+    return values
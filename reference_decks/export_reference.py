@@ -0,0 +1,10 @@
+# Input deck of the first stage of the CAE model for the design x0 of deck_check.py, written as cae_x0.inp.
+# Run in this folder: abaqus cae noGUI=export_reference.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.getcwd()))
+
+from fem_model import model
+
+model([1.0, 0.1, 0.5, 0.9], 'cae_x0', export=True)
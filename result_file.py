@@ -0,0 +1,25 @@
+import json
+import os
+
+# Small per-evaluation record written by the Abaqus side and read by the optimisation driver:
+# {"x": [...], "delta": float, "status": "ok" | "infeasible" | "terminated" | "error", "diagnostics": {...}}
+name = "result.json"
+
+# marker left in the work directory when a running evaluation is terminated early (see monitor.py)
+stop_name = "terminated"
+
+
+def write_result(record, folder="."):
+    # write to a temporary file first, so the driver never reads a half-written record
+    path = os.path.join(folder, name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(record, f)
+    os.rename(path + ".tmp", path)
+
+
+def read_result(folder="."):
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
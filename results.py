@@ -0,0 +1,54 @@
+import os
+import re
+
+import numpy as np
+
+# Compact record of the strain energy curve of one evaluation, read without opening the full odb:
+# a "curve.npz" file holding the ALLSE history and the matching step times (frame values).
+name = "curve.npz"
+
+number = r"[-+]?\d*\.?\d+(?:[EeDd][-+]?\d+)?"
+time_line = re.compile(r"STEP TIME COMPLETED\s+(" + number + ")")
+energy_line = re.compile(r"RECOVERABLE STRAIN ENERGY.*?(" + number + r")\s*$")
+
+
+def stream_energy(f):
+    # yield (step time, ALLSE) for every increment printed by *Energy Print in an open .dat file,
+    # line by line so that the file of a running job can be followed as well
+    current = 0.0
+    for line in f:
+        match = time_line.search(line)
+        if match:
+            current = float(match.group(1))
+            continue
+        match = energy_line.search(line)
+        if match:
+            yield current, float(match.group(1))
+
+
+def read_energy(dat_path, initial=0.0):
+    # energy and step time arrays of a .dat file, starting from the undeformed state as the odb history
+    # (from the `initial` energy of the state a restarted job continues from)
+    times, energies = [0.0], [initial]
+    with open(dat_path, "r") as f:
+        for time, energy in stream_energy(f):
+            times.append(time)
+            energies.append(energy)
+    return np.array(energies), np.array(times)
+
+
+def odb_energy(odb, step='Analysis'):
+    # ALLSE history of the whole model read from the history region only, no field frame is loaded
+    region = odb.steps[step].historyRegions['Assembly ASSEMBLY']
+    data = np.array(region.historyOutputs['ALLSE'].data)
+    return data[:, 1], data[:, 0]
+
+
+def save_curve(energy, displacement, folder="."):
+    np.savez_compressed(os.path.join(folder, name), energy=np.asarray(energy, dtype=float),
+                        displacement=np.asarray(displacement, dtype=float))
+
+
+def load_curve(path):
+    with np.load(path) as data:
+        return data["energy"], data["displacement"]
@@ -0,0 +1,139 @@
+import os
+import shlex
+import threading
+
+from launcher import Launcher, log_file
+from result_file import stop_name
+
+# Share the hosts of a campaign between the evaluations. The scheduler knows the cores, memory and GPUs of
+# every host and the Abaqus analysis tokens of the license server, and picks the number of cores per job
+# that gives the most evaluations per hour: small shell models scale badly, so several 2-core jobs often
+# beat one 6-core job. Each job gets a slot (host, cores, memory share, GPU) and runs through the backend of its host:
+#     LocalBackend : local processes started by the asyncio launcher,
+#     SSHBackend   : the same command run on a remote host through ssh, the work directories must be on a
+#                    file system shared with the driver; on a timeout the remote job is terminated too.
+
+
+def tokens(cpus):
+    # Abaqus analysis tokens of a job on `cpus` cores
+    return int(5 * cpus ** 0.422)
+
+
+def speedup(cpus, serial_fraction):
+    # Amdahl's law, the default serial fraction fits the small shell models of the optimisation
+    return 1.0 / (serial_fraction + (1.0 - serial_fraction) / cpus)
+
+
+class LocalBackend:
+
+    def __init__(self, launcher=None):
+        self.launcher = launcher or Launcher()
+
+    def run(self, args, cwd=None, timeout=None):
+        return self.launcher.run(args, cwd=cwd, timeout=timeout)
+
+
+class SSHBackend:
+
+    def __init__(self, host, launcher=None):
+        self.host = host
+        self.launcher = launcher or Launcher()
+
+    def run(self, args, cwd=None, timeout=None):
+        completed = self.launcher.run(["ssh", self.host, self.remote(args, cwd)], cwd=cwd, timeout=timeout,
+                                      log=log_file(args))
+        if completed.stderr == b"timeout":
+            self.terminate(args, cwd)
+        return completed
+
+    def remote(self, args, cwd):
+        return "cd " + shlex.quote(cwd or ".") + " && " + " ".join(shlex.quote(arg) for arg in args)
+
+    def terminate(self, args, cwd):
+        # a timeout only kills the local ssh client, the remote job would keep its cores and license tokens:
+        # the marker stops the next stages of a CAE script and the job is terminated on the host; the job of
+        # a CAE script is named after its work directory
+        if cwd is not None:
+            open(os.path.join(cwd, stop_name), "w").close()
+        jobs = [arg[len("job="):] for arg in args if arg.startswith("job=")]
+        if not jobs and cwd is not None:
+            jobs = [os.path.basename(os.path.normpath(cwd))]
+        for job in jobs:
+            command = ["abaqus", "terminate", "job=" + job]
+            self.launcher.run(["ssh", self.host, self.remote(command, cwd)], cwd=cwd, log=log_file(command))
+
+
+class Host:
+
+    def __init__(self, name, cores, memory, gpus=0, backend=None):
+        self.name = name
+        self.cores = cores
+        self.memory = memory  # GB available to the Abaqus jobs
+        self.gpus = gpus
+        self.backend = backend or LocalBackend()
+
+
+class Slot:
+
+    def __init__(self, host, cpus, memory, gpus=0):
+        self.host = host
+        self.cpus = cpus
+        self.memory = memory  # percentage of the host memory given to the job
+        self.gpus = gpus
+        self.busy = False
+
+
+class Scheduler:
+
+    def __init__(self, hosts, tokens, memory_per_job=4.0, serial_fraction=0.3, choices=(1, 2, 4, 6, 8)):
+        self.hosts = hosts
+        self.tokens = tokens  # analysis tokens of the license server available to the campaign
+        self.memory_per_job = memory_per_job
+        self.serial_fraction = serial_fraction
+        self.choices = choices
+        self.cpus, self.slots = self.plan()
+        self.condition = threading.Condition()
+
+    def jobs(self, cpus):
+        # number of jobs of `cpus` cores running at the same time on every host, within the license tokens
+        per_host = [min(host.cores // cpus, int(host.memory // self.memory_per_job)) for host in self.hosts]
+        budget = self.tokens // tokens(cpus)
+        counts = [0] * len(self.hosts)
+        while budget > 0 and any(count < limit for count, limit in zip(counts, per_host)):
+            for k in range(len(self.hosts)):  # spread the jobs over the hosts in turn
+                if budget > 0 and counts[k] < per_host[k]:
+                    counts[k] += 1
+                    budget -= 1
+        return counts
+
+    def rate(self, cpus):
+        # evaluations per unit of single-core run time
+        return sum(self.jobs(cpus)) * speedup(cpus, self.serial_fraction)
+
+    def plan(self):
+        cpus = max(self.choices, key=self.rate)
+        slots = []
+        for host, count in zip(self.hosts, self.jobs(cpus)):
+            # one GPU per job for the first jobs of the host, as many as it has GPUs
+            slots += [Slot(host, cpus, max(int(90 / count), 1), 1 if k < host.gpus else 0) for k in range(count)]
+        if not slots:
+            raise ValueError("no host can run a job with the available cores, memory and license tokens")
+        return cpus, slots
+
+    @property
+    def workers(self):
+        return len(self.slots)
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                for slot in self.slots:
+                    if not slot.busy:
+                        slot.busy = True
+                        return slot
+                self.condition.wait()
+
+    def release(self, slot):
+        with self.condition:
+            slot.busy = False
+            self.condition.notify()
@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+
+# Cheap models of the blackbox fitted on the evaluation history of the cache:
+#     - a cubic radial basis function with a linear tail interpolating the objective of the successful runs,
+#     - a kernel estimate of the probability that a run is infeasible or fails.
+# The fit uses at most `max_points` evaluations (the most recent ones), so a refit solves a small dense
+# system and a prediction costs a few vector operations.
+
+
+class Surrogate:
+
+    def __init__(self, lb, ub, max_points=200, min_points=20, margin=0.1, max_failure=0.9, bandwidth=0.1,
+                 smoothing=1e-10):
+        self.lb = np.asarray(lb, dtype=float)
+        self.ub = np.asarray(ub, dtype=float)
+        self.max_points = max_points
+        self.min_points = min_points
+        self.margin = margin
+        self.max_failure = max_failure
+        self.bandwidth = bandwidth
+        self.smoothing = smoothing
+        self.size = 0  # evaluations given to the last fit, before keeping the last max_points
+        self.version = None  # cache.Cache.version() at the last fit
+        self.centers = None
+        self.weights = None
+        self.failed_points = np.zeros((0, len(self.lb)))
+        self.failed = np.zeros(0)
+        self.lock = threading.Lock()
+
+    def scale(self, x):
+        return (np.atleast_2d(np.asarray(x, dtype=float)) - self.lb) / (self.ub - self.lb)
+
+    def fit(self, history):
+        # history: list of {"x", "objective", "status"} as given by cache.Cache.history()
+        size = len(history)
+        history = history[-self.max_points:]
+        points = self.scale([h["x"] for h in history]) if history else np.zeros((0, len(self.lb)))
+        failed = np.array([h["status"] != "ok" for h in history], dtype=float)
+        ok = failed == 0
+
+        centers = points[ok]
+        values = np.array([h["objective"] for h in history], dtype=float)[ok]
+        weights = None
+        if len(centers) > len(self.lb) + 1:
+            k, d = centers.shape
+            phi = np.linalg.norm(centers[:, None] - centers[None], axis=-1) ** 3 + self.smoothing * np.eye(k)
+            tail = np.hstack((np.ones((k, 1)), centers))
+            system = np.block([[phi, tail], [tail.T, np.zeros((d + 1, d + 1))]])
+            rhs = np.concatenate((values, np.zeros(d + 1)))
+            weights = np.linalg.lstsq(system, rhs, rcond=None)[0]
+
+        with self.lock:
+            self.size = size
+            self.centers, self.weights = centers, weights
+            self.failed_points, self.failed = points, failed
+
+    def update(self, cache):
+        # refit only when the cache holds new evaluations, on the last `max_points` of them
+        version = cache.version()
+        if version != self.version:
+            self.fit(cache.history(self.max_points))
+            self.version = version
+
+    def predict(self, x):
+        # predicted objective (nan until enough successful runs) and probability of an infeasible/failed run
+        x = self.scale(x)
+        with self.lock:
+            centers, weights = self.centers, self.weights
+            points, failed = self.failed_points, self.failed
+
+        if weights is None:
+            objective = np.full(len(x), np.nan)
+        else:
+            phi = np.linalg.norm(x[:, None] - centers[None], axis=-1) ** 3
+            objective = phi @ weights[:len(centers)] + weights[len(centers)] + x @ weights[len(centers) + 1:]
+
+        kernel = np.exp(-0.5 * (np.linalg.norm(x[:, None] - points[None], axis=-1) / self.bandwidth) ** 2)
+        prior = 1e-3  # weight of a 50 % guess far from any evaluation
+        failure = (kernel @ failed + 0.5 * prior) / (kernel.sum(axis=1) + prior)
+        return objective, failure
+
+    def screen(self, x, incumbent):
+        # False when the point is predicted to fail or to be worse than the incumbent by more than the margin
+        if self.size < self.min_points:
+            return True
+        objective, failure = self.predict(x)
+        if failure[0] > self.max_failure:
+            return False
+        return not (np.isfinite(objective[0]) and objective[0] > incumbent + self.margin)
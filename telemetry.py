@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Timing of every evaluation, one JSON line per evaluation in the telemetry file of the campaign:
+#     {"x", "project", "mesh_scale", "status", "total", "phases": {driver phases},
+#      "abaqus": {phases stamped inside Abaqus}, "sta": {job: increments/cutbacks}, "odb_size" (all the jobs),
+#      "memory": {job: MB}, "peak_memory" (MB, largest job)}
+# The Abaqus side (Launch.py, fem_model, post_process, headless decks) only appends timestamps to a small
+# text file of the work directory with stamp(), the driver turns them into durations.
+# Summary of a campaign: python telemetry.py [telemetry.jsonl]
+
+stamp_name = "timing.txt"
+estimate_header = "M E M O R Y   E S T I M A T E"
+used_line = re.compile(r"MEMORY\s+USED\D*?(\d+(?:\.\d+)?)\s*(KB|MB|GB)", re.IGNORECASE)
+units = {"KB": 1.0 / 1024, "MB": 1.0, "GB": 1024.0}
+write_lock = threading.Lock()
+
+
+def stamp(name, folder="."):
+    with open(os.path.join(folder, stamp_name), "a") as f:
+        f.write(name + "\t" + repr(time.time()) + "\n")
+
+
+def read_stamps(folder, start):
+    # duration of every stamped phase, measured from the previous stamp (from `start` for the first one)
+    phases = {}
+    path = os.path.join(folder, stamp_name)
+    if not os.path.exists(path):
+        return phases
+    previous = start
+    with open(path, "r") as f:
+        for line in f:
+            name, value = line.rstrip("\n").split("\t")
+            phases[name] = float(value) - previous
+            previous = float(value)
+    return phases
+
+
+def sta_statistics(folder, jobs):
+    # converged increments and cutbacks of every job, from the .sta files
+    from monitor import parse_sta_line
+    statistics = {}
+    for job in jobs:
+        path = os.path.join(folder, job + ".sta")
+        if not os.path.exists(path):
+            continue
+        increments, cutbacks = 0, 0
+        with open(path, "r") as f:
+            for line in f:
+                increment = parse_sta_line(line)
+                if increment is not None:
+                    cutbacks += increment[1]
+                    increments += not increment[1]
+        statistics[job] = {"increments": increments, "cutbacks": cutbacks}
+    return statistics
+
+
+def job_memory(folder, job):
+    # memory (MB) of one Abaqus job: the memory used as reported in the .msg file, otherwise the "memory to
+    # minimize I/O" of the memory estimate of the .dat file, None without either
+    used = None
+    path = os.path.join(folder, job + ".msg")
+    if os.path.exists(path):
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                match = used_line.search(line)
+                if match:
+                    value = float(match.group(1)) * units[match.group(2).upper()]
+                    used = value if used is None else max(used, value)
+    if used is not None:
+        return used
+
+    estimate, table = None, False
+    path = os.path.join(folder, job + ".dat")
+    if os.path.exists(path):
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                if estimate_header in line:
+                    table = True
+                elif table:
+                    # one row per process: process, floating point operations, minimum memory, memory to minimize I/O
+                    words = line.split()
+                    if len(words) == 4 and words[0].isdigit():
+                        estimate = max(estimate or 0.0, float(words[3]))
+                    elif estimate is not None and words:
+                        table = False
+    return estimate
+
+
+class Telemetry:
+
+    def __init__(self, x, mesh_scale=1.0):
+        self.data = {"x": list(x), "mesh_scale": mesh_scale, "start": time.time(), "phases": {}}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.data["phases"][name] = time.time() - start
+
+    def files(self, folder, project, jobs, launched):
+        # what is left in the work directory once the Abaqus run launched at `launched` is over
+        odbs = [os.path.join(folder, job + ".odb") for job in jobs]
+        sizes = [os.path.getsize(odb) for odb in odbs if os.path.exists(odb)]
+        memory = {job: job_memory(folder, job) for job in jobs}
+        memory = {job: value for job, value in memory.items() if value is not None}
+        self.data["project"] = project
+        self.data["abaqus"] = read_stamps(folder, launched)
+        self.data["sta"] = sta_statistics(folder, jobs)
+        self.data["odb_size"] = sum(sizes) if sizes else None
+        self.data["memory"] = memory
+        self.data["peak_memory"] = max(memory.values()) if memory else None
+
+    def write(self, path, status):
+        self.data["status"] = status
+        self.data["total"] = time.time() - self.data["start"]
+        with write_lock:
+            with open(path, "a") as f:
+                f.write(json.dumps(self.data) + "\n")
+
+
+def load(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summary(path="telemetry.jsonl", outliers=5):
+    records = load(path)
+    print(str(len(records)) + " evaluations in " + path)
+    statuses = {}
+    for record in records:
+        statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+    print("status: " + ", ".join(k + " " + str(v) for k, v in sorted(statuses.items())))
+
+    # distribution of every phase, in seconds
+    columns = {"total": [record["total"] for record in records]}
+    for record in records:
+        for group in ("phases", "abaqus"):
+            for name, value in record.get(group, {}).items():
+                columns.setdefault(group + "/" + name, []).append(value)
+    print("%-28s %6s %10s %10s %10s %10s" % ("phase", "count", "mean", "median", "p90", "max"))
+    for name in sorted(columns):
+        values = np.array(columns[name])
+        print("%-28s %6d %10.2f %10.2f %10.2f %10.2f" % (name, len(values), values.mean(), np.median(values),
+                                                          np.percentile(values, 90), values.max()))
+
+    # slowest runs, and the runs far above the median (more than 3 median absolute deviations)
+    total = np.array(columns["total"])
+    deviation = np.median(np.abs(total - np.median(total)))
+    print("slowest evaluations:")
+    for k in np.argsort(total)[::-1][:outliers]:
+        far = deviation > 0 and total[k] > np.median(total) + 3 * deviation
+        print("  %10.1f s  %-10s %s%s" % (total[k], records[k]["status"], records[k]["x"], "  outlier" if far else ""))
+
+
+if __name__ == "__main__":
+    summary(*sys.argv[1:2])
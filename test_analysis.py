@@ -0,0 +1,76 @@
+import numpy as np
+
+from analysis import barrier, barrier_batch
+
+# barrier_batch on NaN padded stacks against the loop of the original analysis, one curve at a time
+# python -m pytest test_analysis.py
+
+
+def barrier_loop(energy, displacement, threshold=0.25):
+    # the loop of post_process before analysis.py, the well stopped at the first frame instead of wrapping around
+    slope = [(energy[i + 1] - energy[i]) / (displacement[i + 1] - displacement[i]) for i in range(len(energy) - 2)]
+    negative = [i for i in range(len(slope)) if slope[i] < 0]
+    if not negative:
+        return -float('inf')
+    end = negative[-1]
+    start = end - 1
+    while start >= 0 and slope[start] < 0:
+        start -= 1
+    if float(start) / len(slope) > threshold:
+        return (energy[start + 2] - energy[end + 1]) / energy[start + 2]
+    return -float('inf')
+
+
+def pad(curves, width):
+    return np.array([np.concatenate((curve, np.full(width - len(curve), np.nan))) for curve in curves])
+
+
+def snap_curve(rng, frames):
+    # rising energy with a well of random position and depth, and random noise
+    displacement = np.linspace(0.0, 1.0, frames)
+    energy = displacement ** 2 + 0.2 * rng.random(frames)
+    drop = rng.integers(1, frames - 2)
+    energy[drop:] -= rng.random() * energy[drop]
+    return energy, displacement
+
+
+def test_random_padded_curves():
+    rng = np.random.default_rng(0)
+    curves = [snap_curve(rng, frames) for frames in rng.integers(4, 60, size=200)]
+    width = max(len(energy) for energy, displacement in curves)
+    delta = barrier_batch(pad([e for e, d in curves], width), pad([d for e, d in curves], width))
+    expected = [barrier_loop(energy, displacement) for energy, displacement in curves]
+    assert np.isfinite(expected).any() and not np.isfinite(expected).all()
+    np.testing.assert_allclose(delta, expected)
+    np.testing.assert_allclose([barrier(energy, displacement) for energy, displacement in curves], expected)
+
+
+def test_no_negative_slope():
+    displacement = np.linspace(0.0, 1.0, 10)
+    energy = displacement ** 2
+    assert barrier(energy, displacement) == -np.inf
+    # only the slope to the last frame is negative, it is left out
+    energy[-1] = 0.0
+    assert barrier_loop(energy, displacement) == -np.inf
+    assert barrier(energy, displacement) == -np.inf
+    assert barrier_batch(pad([energy], 12), pad([displacement], 12))[0] == -np.inf
+
+
+def test_well_at_first_frame():
+    displacement = np.linspace(0.0, 1.0, 10)
+    energy = np.array([1.0, 0.8, 0.6, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0])
+    assert barrier_loop(energy, displacement) == -np.inf
+    assert barrier(energy, displacement) == -np.inf
+    assert barrier_batch(pad([energy], 12), pad([displacement], 12))[0] == -np.inf
+
+
+def test_padded_short_curve():
+    # a 10 frame curve in a 12 column stack, its well ending at its second last slope
+    displacement = np.linspace(0.0, 1.0, 10)
+    energy = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.5, 0.4, 0.45])
+    long_displacement = np.linspace(0.0, 1.0, 12)
+    long_energy = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.5, 0.4, 0.6, 0.7])
+    delta = barrier_batch(pad([energy, long_energy], 12), pad([displacement, long_displacement], 12))
+    expected = [barrier_loop(energy, displacement), barrier_loop(long_energy, long_displacement)]
+    assert np.isfinite(expected).all()
+    np.testing.assert_allclose(delta, expected)